@@ -0,0 +1,59 @@
+"""
+Download throughput from the local HTTP server.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+
+from .fixtures import MiB, Server, make_random, file_info, register
+
+SERVERS = {
+    "default": dict(),
+    "latency": dict(latency=0.05),
+    "bandwidth": dict(bandwidth=50 * MiB),
+    "no_length": dict(content_length=False),
+    "no_range": dict(range=False),
+}
+
+
+class Download:
+    params = ([16, 128], list(SERVERS.keys()), [1, 4])
+    param_names = ["size_mib", "server", "segments"]
+    number = 1
+    repeat = 3
+    warmup_time = 0
+    timeout = 600
+
+    def setup_cache(self):
+        root = os.path.abspath("download")
+        os.makedirs(root, exist_ok=True)
+        for size in self.params[0]:
+            make_random(os.path.join(root, f"random_{size}.bin"), size * MiB)
+        return root
+
+    def setup(self, root, size, server, segments):
+        self.server = Server(root, **SERVERS[server])
+        name = f"random_{size}.bin"
+        finfo = file_info(os.path.join(root, name), self.server.url(name))
+        self.dataset = register("bench_download", [finfo])
+        self.data_dir = tempfile.mkdtemp()
+        self.size = finfo["size"]
+
+    def teardown(self, root, size, server, segments):
+        self.server.close()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def download(self, segments):
+        self.dataset.download(data_dir=self.data_dir, full=True, segments=segments)
+
+    def time_download(self, root, size, server, segments):
+        self.download(segments)
+
+    def track_throughput(self, root, size, server, segments):
+        start = time.perf_counter()
+        self.download(segments)
+        return self.size / MiB / (time.perf_counter() - start)
+
+    track_throughput.unit = "MiB/s"
@@ -0,0 +1,309 @@
+"""
+Local HTTP server and synthetic datasets for the benchmarks.
+
+The server serves the files of a directory with a configurable latency
+before every response and bandwidth per connection, and can omit
+the Content-Length header or ignore Range requests.
+For the tests, it can also answer 503 or close the connection in the middle
+of a response, and it records the requests it receives.
+Synthetic datasets are registered as mudatasets.datasets.<name>
+so that they can be downloaded and loaded like the datasets in the registry.
+"""
+
+import os
+import re
+import sys
+import gzip
+import time
+import types
+import socket
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+from mudatasets.core import MuDataSet
+
+MiB = 1024 * 1024
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.serve(body=False)
+
+    def do_GET(self):
+        self.serve(body=True)
+
+    def serve(self, body=True):
+        config = self.server.config
+        self.server.requests.append({"method": self.command, "path": self.path, "range": self.headers.get("Range")})
+        if config["latency"] > 0:
+            time.sleep(config["latency"])
+
+        with self.server.lock:
+            fail = config["failures"] > 0
+            if fail:
+                config["failures"] -= 1
+        if fail:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        path = os.path.join(self.server.root, self.path.lstrip("/").split("?")[0])
+        if not os.path.isfile(path):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        size = os.path.getsize(path)
+        start, end, status = 0, size - 1, 200
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and config["range"]:
+            start = int(match.group(1))
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            status = 206
+
+        self.send_response(status)
+        if config["range"]:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        if config["content_length"]:
+            self.send_header("Content-Length", str(end - start + 1))
+        else:
+            # The end of the response is signalled by closing the connection
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        if not body:
+            return
+
+        block = 256 * 1024
+        with open(path, "rb") as f:
+            f.seek(start)
+            left = end - start + 1
+            sent_at = time.perf_counter()
+            while left > 0:
+                data = f.read(min(block, left))
+                with self.server.lock:
+                    reset = config["reset_after"] is not None and len(data) > config["reset_after"]
+                    if reset:
+                        data = data[: config["reset_after"]]
+                        config["reset_after"] = None
+                    elif config["reset_after"] is not None:
+                        config["reset_after"] -= len(data)
+                self.wfile.write(data)
+                if reset:
+                    # Close the connection in the middle of the response
+                    self.wfile.flush()
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    self.close_connection = True
+                    return
+                left -= len(data)
+                if config["bandwidth"] is not None:
+                    # Sleep until the bytes sent fit into the bandwidth
+                    sent_at += len(data) / config["bandwidth"]
+                    delay = sent_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+
+class Server:
+    """
+    Serve the files in root on a free port of localhost in a background thread.
+
+        with Server(root, latency=0.05, bandwidth=10 * MiB) as server:
+            url = server.url("file.h5mu")
+
+    With failures=n, the first n requests are answered with 503,
+    with reset_after=n, the connection is closed after n bytes of the responses.
+    Both can be changed in .config while the server is running.
+    """
+
+    def __init__(
+        self, root, latency=0.0, bandwidth=None, content_length=True, range=True, failures=0, reset_after=None
+    ):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.root = root
+        self.httpd.config = {
+            "latency": latency,
+            "bandwidth": bandwidth,
+            "content_length": content_length,
+            "range": range,
+            "failures": failures,
+            "reset_after": reset_after,
+        }
+        self.httpd.lock = threading.Lock()
+        # Method, path and Range header of every request
+        self.httpd.requests = []
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def config(self):
+        return self.httpd.config
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def url(self, name):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/{name}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _csr(n_obs, n_vars, density, seed=0):
+    from scipy.sparse import random as sparse_random
+
+    rng = np.random.default_rng(seed)
+    x = sparse_random(n_obs, n_vars, density=density, format="csr", dtype=np.float32, random_state=rng)
+    x.data = rng.integers(1, 50, len(x.data)).astype(np.float32)
+    return x
+
+
+def make_h5mu(path, n_obs=10000, n_vars=(2000, 20000), density=0.05, seed=0):
+    """
+    Write a .h5mu file with an rna and an atac modality of sparse counts.
+    """
+    import pandas as pd
+    from mudata import AnnData, MuData
+
+    obs = pd.DataFrame(index=[f"cell{i}" for i in range(n_obs)])
+    mods = dict()
+    for k, (m, n) in enumerate(zip(["rna", "atac"], n_vars)):
+        var = pd.DataFrame(index=[f"{m}{j}" for j in range(n)])
+        mods[m] = AnnData(X=_csr(n_obs, n, density, seed + k), obs=obs.copy(), var=var)
+    MuData(mods).write(path)
+    return path
+
+
+def make_10x_h5(path, n_obs=10000, n_vars=(2000, 20000), density=0.05, seed=0):
+    """
+    Write a feature-barcode matrix in the 10x Genomics HDF5 format
+    with Gene Expression and Peaks features.
+    """
+    import h5py
+    from scipy.sparse import hstack
+
+    x = hstack([_csr(n_obs, n, density, seed + k) for k, n in enumerate(n_vars)], format="csr")
+    x.data = x.data.astype(np.int32)
+    types = np.repeat([b"Gene Expression", b"Peaks"], n_vars)
+    names = np.array([f"feature{j}".encode() for j in range(sum(n_vars))])
+    with h5py.File(path, "w") as f:
+        m = f.create_group("matrix")
+        # Cells in columns: CSR with cells in rows has the same layout as CSC
+        m.create_dataset("data", data=x.data, compression="gzip", compression_opts=4)
+        m.create_dataset("indices", data=x.indices.astype(np.int64), compression="gzip", compression_opts=4)
+        m.create_dataset("indptr", data=x.indptr.astype(np.int64))
+        m.create_dataset("shape", data=np.array([sum(n_vars), n_obs], dtype=np.int32))
+        m.create_dataset("barcodes", data=np.array([f"cell{i}".encode() for i in range(n_obs)]))
+        features = m.create_group("features")
+        features.create_dataset("id", data=names)
+        features.create_dataset("name", data=names)
+        features.create_dataset("feature_type", data=types)
+        features.create_dataset("genome", data=np.repeat(b"GRCh38", sum(n_vars)))
+        features.create_dataset("_all_tag_keys", data=np.array([b"genome"]))
+    return path
+
+
+def make_tsv_gz(path, n_obs=2000, n_vars=2000, density=0.05, seed=0):
+    """
+    Write a dense features x cells count matrix as a gzipped TSV file
+    with a header of cell names and feature names in the first column.
+    """
+    x = _csr(n_vars, n_obs, density, seed).astype(np.int32).toarray()
+    with gzip.open(path, "wt", compresslevel=1) as f:
+        f.write("\t".join(f"cell{i}" for i in range(n_obs)) + "\n")
+        for j, row in enumerate(x):
+            f.write(f"feature{j}\t" + "\t".join(map(str, row)) + "\n")
+    return path
+
+
+def make_random(path, size, seed=0):
+    """
+    Write size random bytes, e.g. to measure the download throughput.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "wb") as f:
+        for start in range(0, size, 16 * MiB):
+            f.write(rng.bytes(min(16 * MiB, size - start)))
+    return path
+
+
+def file_info(path, url):
+    with open(path, "rb") as f:
+        md5 = hashlib.file_digest(f, "md5").hexdigest() if hasattr(hashlib, "file_digest") else hashlib.md5(f.read()).hexdigest()
+    return {"name": os.path.basename(path), "url": url, "size": os.path.getsize(path), "md5": md5}
+
+
+def _load_tsv(self, data_dir="./"):
+    # Custom loader of the synthetic TSV dataset
+    from itertools import islice
+    from scipy.sparse import csr_matrix, vstack
+    import pandas as pd
+    from mudata import AnnData, MuData
+    from mudatasets.utils import open_gzip
+
+    with open_gzip(os.path.join(data_dir, self.files[0]["name"])) as f:
+        obs_names = f.readline().rstrip("\n").split("\t")
+        var_names, blocks = [], []
+        lines = list(islice(f, 1024))
+        while len(lines) > 0:
+            lines = [line.partition("\t") for line in lines]
+            var_names.extend(line[0] for line in lines)
+            blocks.append(csr_matrix(np.loadtxt([line[2] for line in lines], dtype=np.int32, delimiter="\t", ndmin=2)))
+            lines = list(islice(f, 1024))
+    x = vstack(blocks, format="csr").T.tocsr()
+    rna = AnnData(X=x, obs=pd.DataFrame(index=obs_names), var=pd.DataFrame(index=var_names))
+    return MuData({"rna": rna})
+
+
+def register(name, files, loader=False):
+    """
+    Register a dataset with the files described by the dictionaries in files
+    (name, url, size, md5) so that mudatasets.load(name) finds it.
+    With loader=True, the dataset is opened with a custom loader for the TSV format.
+    """
+
+    class Synthetic(MuDataSet):
+        def __init__(self):
+            self.name = name
+            self.version = "1"
+            self.loader_version = "1"
+            self.files = files
+            self.data = {"name": name, "version": "1", "files": files}
+            self.data_versions = [self.data]
+            self.info = {**self.data, "data_versions": self.data_versions}
+
+    if loader:
+        Synthetic.load = _load_tsv
+
+    module = types.ModuleType(f"mudatasets.datasets.{name}")
+    module.dataset = Synthetic
+    sys.modules[module.__name__] = module
+    return Synthetic()
@@ -0,0 +1,80 @@
+"""
+Cold and warm loading of synthetic datasets in the .h5mu, 10x Genomics .h5
+and gzipped TSV formats, the latter opened with a custom loader.
+
+Cold loads include converting 10x Genomics files to .h5mu
+and running and saving the custom loader.
+"""
+
+import os
+import shutil
+import tempfile
+
+from .fixtures import Server, make_h5mu, make_10x_h5, make_tsv_gz, file_info, register
+
+FORMATS = {
+    "h5mu": ("synthetic.h5mu", make_h5mu),
+    "10x_h5": ("synthetic.h5", make_10x_h5),
+    "tsv_gz": ("synthetic.tsv.gz", make_tsv_gz),
+}
+
+
+class Loading:
+    params = (list(FORMATS.keys()), [True, False])
+    param_names = ["format", "backed"]
+    number = 1
+    repeat = 3
+    warmup_time = 0
+    timeout = 600
+
+    def setup_cache(self):
+        root = os.path.abspath("load")
+        os.makedirs(root, exist_ok=True)
+        for name, make in FORMATS.values():
+            make(os.path.join(root, name))
+        return root
+
+    def setup(self, root, fmt, backed):
+        self.server = Server(root)
+        self.data_dir = tempfile.mkdtemp()
+        name = FORMATS[fmt][0]
+        finfo = file_info(os.path.join(root, name), self.server.url(name))
+        self.dataset = register(f"bench_load_{fmt}", [finfo], loader=fmt == "tsv_gz")
+        self.dataset.download(data_dir=self.data_dir, full=True)
+        self.backed = backed
+
+    def teardown(self, root, fmt, backed):
+        self.server.close()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def load(self):
+        import mudatasets
+
+        mdata = mudatasets.load(self.dataset.name, data_dir=self.data_dir, full=True, backed=self.backed)
+        if mdata is not None and mdata.isbacked:
+            mdata.file.close()
+
+
+class Load(Loading):
+    def time_load_cold(self, root, fmt, backed):
+        self.load()
+
+    def peakmem_load_cold(self, root, fmt, backed):
+        self.load()
+
+
+class LoadWarm(Loading):
+    def setup(self, root, fmt, backed):
+        super().setup(root, fmt, backed)
+        # Conversions and the results of custom loaders are saved on the first load
+        self.load()
+
+    def time_load_warm(self, root, fmt, backed):
+        self.load()
+
+    def peakmem_load_warm(self, root, fmt, backed):
+        self.load()
+
+
+def timeraw_import():
+    return "import mudatasets"
@@ -0,0 +1,97 @@
+"""
+Compare cell-wise and feature-wise slicing of a .h5mu file in backed mode
+for different chunk layouts and compression filters.
+
+    python benchmarks/repack.py ~/mudatasets/pbmc3k_multiome/pbmc3k_multiome.h5mu
+
+Variants are written next to the file and removed afterwards
+unless --keep is provided.
+"""
+
+import os
+import sys
+import time
+import argparse
+import warnings
+
+import numpy as np
+
+
+def timeit(f, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench(path, n_cells, n_features, seed=0):
+    import mudata
+
+    rng = np.random.default_rng(seed)
+    mdata = mudata.read(path, backed=True)
+    results = dict()
+    try:
+        for m, adata in mdata.mod.items():
+            n_obs, n_vars = adata.shape
+            block = slice(0, min(n_cells, n_obs))
+            cells = np.sort(rng.choice(n_obs, min(n_cells, n_obs), replace=False))
+            features = np.sort(rng.choice(n_vars, min(n_features, n_vars), replace=False))
+            results[m] = {
+                "cell block": timeit(lambda: adata.X[block]),
+                "random cells": timeit(lambda: adata.X[cells]),
+                "random features": timeit(lambda: adata.X[:, features], repeat=1),
+            }
+    finally:
+        mdata.file.close()
+    return results
+
+
+def main():
+    from mudatasets.repack import repack, variant_path, _codec, CHUNK_BYTES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--layouts", nargs="+", default=["obs", "var"])
+    parser.add_argument("--codecs", nargs="+", default=["none", "gzip", "lzf", "blosc", "zstd"])
+    parser.add_argument("--cells", type=int, default=1000)
+    parser.add_argument("--features", type=int, default=100)
+    parser.add_argument("--chunk-bytes", type=int, default=CHUNK_BYTES)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+
+    variants = [("original", args.path, 0.0)]
+    for codec in args.codecs:
+        try:
+            kwargs = _codec(None if codec == "none" else codec)
+        except ImportError as e:
+            print(f"Skipping {codec}: {e}")
+            continue
+        for layout in args.layouts:
+            out_path = variant_path(args.path, f"bench-{layout}-{codec}")
+            start = time.perf_counter()
+            repack(args.path, out_path, layout=layout, chunk_bytes=args.chunk_bytes, **kwargs)
+            variants.append((f"{layout}/{codec}", out_path, time.perf_counter() - start))
+
+    try:
+        print(f"{'variant':<12} {'MiB':>7} {'repack s':>9}  {'modality':<10} {'cell block':>11} {'rand cells':>11} {'rand feats':>11}")
+        for name, path, repack_time in variants:
+            size = os.path.getsize(path) / 1024**2
+            for m, t in bench(path, args.cells, args.features).items():
+                print(
+                    f"{name:<12} {size:>7.1f} {repack_time:>9.2f}  {m:<10} "
+                    f"{t['cell block']:>11.4f} {t['random cells']:>11.4f} {t['random features']:>11.4f}"
+                )
+    finally:
+        if not args.keep:
+            for name, path, _ in variants[1:]:
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    # Run from a checkout without installing the package
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    main()
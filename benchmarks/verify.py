@@ -0,0 +1,58 @@
+"""
+Verification of files that have been downloaded before.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+
+from .fixtures import MiB, make_random, file_info, register
+
+
+class Verify:
+    params = [16, 256]
+    param_names = ["size_mib"]
+    number = 1
+    repeat = 3
+    warmup_time = 0
+    timeout = 600
+
+    def setup_cache(self):
+        root = os.path.abspath("verify")
+        os.makedirs(root, exist_ok=True)
+        for size in self.params:
+            make_random(os.path.join(root, f"random_{size}.bin"), size * MiB)
+        return root
+
+    def setup(self, root, size):
+        name = f"random_{size}.bin"
+        # The file is never requested since it is already in data_dir
+        finfo = file_info(os.path.join(root, name), "http://127.0.0.1:9/" + name)
+        self.dataset = register("bench_verify", [finfo])
+        self.data_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.data_dir, "bench_verify"))
+        shutil.copy(os.path.join(root, name), os.path.join(self.data_dir, "bench_verify", name))
+        self.size = finfo["size"]
+
+    def teardown(self, root, size):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def time_verify(self, root, size):
+        self.dataset.download(data_dir=self.data_dir, full=True, force_verify=True)
+
+    def track_verify_cached(self, root, size):
+        # The first call records the verified file
+        self.dataset.download(data_dir=self.data_dir, full=True)
+        start = time.perf_counter()
+        self.dataset.download(data_dir=self.data_dir, full=True)
+        return time.perf_counter() - start
+
+    track_verify_cached.unit = "seconds"
+
+    def track_verify_throughput(self, root, size):
+        start = time.perf_counter()
+        self.dataset.download(data_dir=self.data_dir, full=True, force_verify=True)
+        return self.size / MiB / (time.perf_counter() - start)
+
+    track_verify_throughput.unit = "MiB/s"
@@ -1,5 +1,9 @@
 """Multimodal Datasets in MuData format"""
 
-from .core import list_datasets, load, info, list_datasets, serve_webpage
+from .core import list_datasets, load, info, list_datasets, serve_webpage, repack_dataset, DownloadError, ChecksumError
+from .tenx import read_10x_h5_lazy
+from .aio import aload, adownload
+from .events import Metrics
+from . import cache
 
 __version__ = "0.0.3"
@@ -0,0 +1,146 @@
+"""
+Command line interface.
+
+Download and verify datasets without loading them, e.g. to warm
+the data directory of every node before a batch of jobs:
+
+    python -m mudatasets prefetch pbmc3k_multiome brain9k_multiome --full --jobs 2
+
+A JSON summary with the bytes downloaded and the time taken
+for every dataset is printed to stdout, messages and progress bars
+go to stderr. The exit code is 1 if any file could not be downloaded
+and 2 if any file does not match its checksum.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+
+# Temporary files and indices next to the files of a dataset
+AUXILIARY_SUFFIXES = (".lock", ".part", ".segments", ".tmp", ".link", ".gzindex")
+
+
+def _list_files(dset_dir):
+    # Files in a dataset directory without temporary files and indices
+    files = []
+    if os.path.isdir(dset_dir):
+        for name in os.listdir(dset_dir):
+            path = os.path.join(dset_dir, name)
+            if name.startswith(".") or name.endswith(AUXILIARY_SUFFIXES) or not os.path.isfile(path):
+                continue
+            files.append(name)
+    return sorted(files)
+
+
+def prefetch(name, data_dir="~/mudatasets/", **kwargs):
+    """
+    Download and verify the files of a dataset,
+    returning a summary of the files, bytes downloaded and timing.
+    """
+    from .core import _dataset, DownloadError, ChecksumError
+    from .events import Metrics
+
+    summary = {"dataset": name, "status": "ok"}
+    start = time.perf_counter()
+    # Files linked from the store or downloaded by another process are not counted
+    metrics = Metrics()
+    callback = kwargs.pop("callback", None)
+
+    def collect(event):
+        metrics(event)
+        if callback is not None:
+            callback(event)
+
+    try:
+        dset = _dataset(name)
+        try:
+            dset.download(data_dir=data_dir, callback=collect, **kwargs)
+        finally:
+            downloads = [e for e in metrics.events if e["event"] == "download"]
+            summary["files"] = _list_files(os.path.join(os.path.expanduser(data_dir), dset.name))
+            summary["downloaded"] = sorted(e["file"] for e in downloads)
+            summary["bytes"] = sum(e["bytes"] for e in downloads)
+    except DownloadError as e:
+        checksum = any(isinstance(err, ChecksumError) for err in e.errors.values())
+        summary["status"] = "checksum_error" if checksum else "error"
+        summary["errors"] = {f: f"{type(err).__name__}: {err}" for f, err in e.errors.items()}
+    except Exception as e:
+        summary["status"] = "error"
+        summary["errors"] = {name: f"{type(e).__name__}: {e}"}
+
+    seconds = time.perf_counter() - start
+    summary["seconds"] = round(seconds, 3)
+    summary["bytes_per_second"] = round(summary.get("bytes", 0) / seconds) if seconds > 0 else None
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mudatasets", description="Multimodal Datasets")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser(
+        "prefetch",
+        help="download and verify datasets without loading them",
+        description="Download and verify datasets without loading them. "
+        "A JSON summary is printed to stdout.",
+    )
+    cmd.add_argument("datasets", nargs="+", help="names of the datasets")
+    cmd.add_argument("--full", action="store_true", help="download all the files of every dataset")
+    cmd.add_argument("--files", nargs="+", help="names of the files to download")
+    cmd.add_argument("--version", help="data version, the latest one by default")
+    cmd.add_argument("--jobs", type=int, default=1, help="number of datasets downloaded in parallel")
+    cmd.add_argument("--data-dir", default="~/mudatasets/", help="location of the datasets")
+    cmd.add_argument("--max-workers", type=int, default=1, help="number of files downloaded in parallel for every dataset")
+    cmd.add_argument("--segments", type=int, default=1, help="number of connections for every large file")
+    cmd.add_argument("--store-dir", help="content-addressed store shared between users")
+    cmd.add_argument("--mirror", help="URL of a mirror started with mudatasets.serve_webpage()")
+    cmd.add_argument("--retries", type=int, default=3, help="number of retries for failed requests")
+    cmd.add_argument("--timeout", type=float, default=60, help="timeout of the requests in seconds")
+    cmd.add_argument("--force-verify", action="store_true", help="hash files that have been verified before")
+    cmd.add_argument("--max-cache-size", help="remove least recently used files to keep data_dir under this size, e.g. 50G")
+
+    args = parser.parse_args(argv)
+
+    kwargs = dict(
+        data_dir=args.data_dir,
+        full=args.full,
+        files=args.files,
+        version=args.version,
+        max_workers=args.max_workers,
+        segments=args.segments,
+        store_dir=args.store_dir,
+        force_verify=args.force_verify,
+        retries=args.retries,
+        timeout=args.timeout,
+        mirror=args.mirror,
+        max_cache_size=args.max_cache_size,
+    )
+
+    start = time.perf_counter()
+    # Keep stdout for the summary
+    with redirect_stdout(sys.stderr):
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+            summaries = list(executor.map(lambda name: prefetch(name, **kwargs), args.datasets))
+
+    result = {
+        "datasets": summaries,
+        "bytes": sum(s.get("bytes", 0) for s in summaries),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    json.dump(result, sys.stdout, indent=1)
+    sys.stdout.write("\n")
+
+    if any(s["status"] == "checksum_error" for s in summaries):
+        return 2
+    if any(s["status"] != "ok" for s in summaries):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
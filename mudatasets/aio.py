@@ -0,0 +1,53 @@
+"""
+Coroutine variants of load() and MuDataSet.download() for asyncio applications.
+
+Transfers, checksums and reading run in the default executor of the event loop,
+so that the loop is never blocked. Cancelling the task stops the transfers
+at their next chunk and keeps the partial files for resuming them later.
+"""
+
+import asyncio
+from functools import partial
+from threading import Event
+
+
+async def _run(f, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    cancel = Event()
+    future = loop.run_in_executor(None, partial(f, *args, cancel=cancel, **kwargs))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # Wait for the transfers to stop so that no thread
+        # keeps writing to the files once the task is cancelled
+        cancel.set()
+        try:
+            await future
+        except Exception:
+            pass
+        raise
+
+
+async def adownload(dataset, **kwargs):
+    """
+    Download the files of a dataset, given by its name or as a MuDataSet,
+    returning the same (path, info) tuple as MuDataSet.download().
+
+    Keyword arguments are passed to MuDataSet.download().
+    """
+    from .core import _dataset
+
+    if isinstance(dataset, str):
+        dataset = _dataset(dataset)
+    return await _run(dataset.download, **kwargs)
+
+
+async def aload(dataset, **kwargs):
+    """
+    Download and open a dataset returning the same result as load().
+
+    Keyword arguments are passed to load().
+    """
+    from .core import load
+
+    return await _run(load, dataset, **kwargs)
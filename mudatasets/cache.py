@@ -0,0 +1,268 @@
+"""
+Size-bounded cache of the datasets in data_dir.
+
+The last access to every file is recorded in data_dir when it is
+downloaded, verified or loaded. With max_cache_size= for load()
+and MuDataSet.download(), or the MUDATASETS_MAX_CACHE_SIZE environment
+variable (e.g. "50G"), the least recently used files are removed
+before downloading so that data_dir stays under this size
+including the files that are about to be downloaded,
+as estimated from their sizes in the registry.
+
+Files that are being downloaded (their .lock is held) or that are open
+in another process are never removed. Files linked from a shared store
+(store_dir) are only removed from data_dir and stay in the store.
+
+    mds.cache.status()
+    mds.cache.prune(max_cache_size="20G")
+"""
+
+import os
+import re
+import json
+import time
+from threading import Lock
+from warnings import warn
+
+from .utils import file_lock
+from .fetch import PART_SUFFIX, SEGMENTS_SUFFIX
+from .verify import remove_record
+
+# Last access to every file is recorded in this file inside data_dir
+ACCESS_FILE = ".access.json"
+# Temporary files of downloads and conversions that are in progress
+TEMP_SUFFIXES = (".lock", ".tmp", ".link")
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4, "P": 1024 ** 5}
+
+_lock = Lock()
+# Failures to record access are only reported once
+_warned = False
+
+
+def parse_size(size):
+    """
+    Number of bytes for a size such as 1000000, "500M" or "1.5GiB".
+    Units are powers of 1024.
+    """
+    if size is None or isinstance(size, int):
+        return size
+    match = re.match(r"^\s*(\d+(?:\.\d*)?)\s*([KMGTP]?)(?:i?B)?\s*$", str(size), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid size {size}, use a number of bytes or e.g. 500M, 20G")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+def max_size(max_cache_size=None):
+    """
+    max_cache_size in bytes, from MUDATASETS_MAX_CACHE_SIZE if it is not provided.
+    """
+    if max_cache_size is None:
+        max_cache_size = os.environ.get("MUDATASETS_MAX_CACHE_SIZE") or None
+    return parse_size(max_cache_size)
+
+
+def _access_path(data_dir):
+    return os.path.join(data_dir, ACCESS_FILE)
+
+
+def _key(data_dir, path):
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(data_dir))
+
+
+def _read_access(data_dir):
+    try:
+        with open(_access_path(data_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def touch(data_dir, paths):
+    """
+    Record that the files have been accessed now.
+    """
+    global _warned
+    data_dir = os.path.expanduser(data_dir)
+    now = time.time()
+    try:
+        # The lock on the file keeps the records added by other processes
+        with _lock, file_lock(_access_path(data_dir)):
+            access = _read_access(data_dir)
+            for path in paths:
+                access[_key(data_dir, path)] = now
+            access = {k: v for k, v in access.items() if os.path.exists(os.path.join(data_dir, k))}
+            tmp_path = f"{_access_path(data_dir)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(access, f, indent=1)
+            os.replace(tmp_path, _access_path(data_dir))
+    except OSError as e:
+        # Files are then evicted by their modification time, e.g. data_dir can be read-only
+        if not _warned:
+            _warned = True
+            warn(f"Access to files cannot be recorded in {data_dir}: {e}")
+
+
+def _owner(path):
+    # Partial downloads are locked with the file they will become
+    for suffix in (SEGMENTS_SUFFIX, PART_SUFFIX):
+        if path.endswith(suffix):
+            path = path[: -len(suffix)]
+    return path
+
+
+def _is_open(path):
+    # HDF5 holds a shared lock on the files it reads
+    try:
+        import fcntl
+    except ImportError:
+        # Files that are open cannot be removed on Windows
+        return False
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except OSError:
+        return True
+    finally:
+        os.close(fd)
+
+
+def _lock_path(path):
+    return _owner(path) + ".lock"
+
+
+def _is_locked(path):
+    # Files without a .lock have never been locked, it is not created to check
+    if os.path.exists(_lock_path(path)):
+        try:
+            with file_lock(_owner(path), blocking=False):
+                pass
+        except BlockingIOError:
+            return True
+    return _is_open(path)
+
+
+def _files(data_dir):
+    # Files of all the datasets with their size and last access
+    access = _read_access(data_dir)
+    files = []
+    if not os.path.isdir(data_dir):
+        return files
+    for dataset in sorted(os.listdir(data_dir)):
+        dset_dir = os.path.join(data_dir, dataset)
+        if dataset.startswith(".") or not os.path.isdir(dset_dir):
+            continue
+        for name in sorted(os.listdir(dset_dir)):
+            path = os.path.join(dset_dir, name)
+            if name.startswith(".") or name.endswith(TEMP_SUFFIXES) or not os.path.isfile(path):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            # Files downloaded before access was recorded were last used when they were written
+            last_access = max(access.get(_key(data_dir, path), 0), stat.st_mtime)
+            files.append({"dataset": dataset, "name": name, "path": path, "bytes": stat.st_size, "last_access": last_access})
+    return files
+
+
+def _registry_files(dataset):
+    # Files of the current version of a dataset as listed in the registry
+    from .core import info
+
+    try:
+        dset_info = info(dataset)
+    except ValueError:
+        return None
+    for data in dset_info.get("data_versions", []):
+        if data["version"] == dset_info.get("version"):
+            return data["files"]
+    return dset_info.get("files")
+
+
+def status(data_dir="~/mudatasets/", max_cache_size=None):
+    """
+    Size of data_dir and of every dataset in it, and the files
+    with their size, last access and whether they are in use.
+
+    For datasets in the registry, registry_bytes is the size of all
+    the files of the current version and missing_bytes is the size
+    of the ones that have not been downloaded.
+    """
+    data_dir = os.path.expanduser(data_dir)
+    datasets = dict()
+    for file in _files(data_dir):
+        dset = datasets.setdefault(file["dataset"], {"bytes": 0, "files": []})
+        dset["bytes"] += file["bytes"]
+        dset["files"].append(
+            {
+                "name": file["name"],
+                "bytes": file["bytes"],
+                "last_access": file["last_access"],
+                "in_use": _is_locked(file["path"]),
+            }
+        )
+
+    for name, dset in datasets.items():
+        registry_files = _registry_files(name)
+        if registry_files is None:
+            continue
+        names = {f["name"] for f in dset["files"]}
+        dset["registry_bytes"] = sum(f.get("size") or 0 for f in registry_files)
+        dset["missing_bytes"] = sum(f.get("size") or 0 for f in registry_files if f["name"] not in names)
+
+    return {
+        "data_dir": data_dir,
+        "bytes": sum(dset["bytes"] for dset in datasets.values()),
+        "max_cache_size": max_size(max_cache_size),
+        "datasets": datasets,
+    }
+
+
+def prune(max_cache_size=None, data_dir="~/mudatasets/", reserve=0, keep=None, dry_run=False, emit=None):
+    """
+    Remove the least recently used files until data_dir
+    and another reserve bytes fit into max_cache_size.
+
+    Files in keep, files that are being downloaded and files that are open
+    are not removed. With dry_run=True, the files are only listed.
+    Every removed file is reported as an evict event to emit, see mudatasets.events.
+
+    Returns the removed files, the bytes freed and the size of data_dir.
+    """
+    data_dir = os.path.expanduser(data_dir)
+    limit = max_size(max_cache_size)
+    if limit is None:
+        raise ValueError("max_cache_size has to be provided or set with MUDATASETS_MAX_CACHE_SIZE")
+
+    keep = {os.path.abspath(os.path.expanduser(p)) for p in keep or []}
+    files = _files(data_dir)
+    size = sum(file["bytes"] for file in files)
+    removed = []
+    for file in sorted(files, key=lambda f: f["last_access"]):
+        if size + reserve <= limit:
+            break
+        path = file["path"]
+        if os.path.abspath(_owner(path)) in keep:
+            continue
+        try:
+            # Lock files are never removed: a process waiting on a removed lock
+            # and one creating a new lock file could both write to the file
+            with file_lock(_owner(path), blocking=False):
+                if _is_open(path):
+                    continue
+                if not dry_run:
+                    os.remove(path)
+                    remove_record(data_dir, path)
+        except (BlockingIOError, OSError):
+            continue
+        size -= file["bytes"]
+        removed.append({key: file[key] for key in ("dataset", "name", "bytes", "last_access")})
+        if emit is not None:
+            emit("evict", file=file["name"], dataset=file["dataset"], bytes=file["bytes"], last_access=file["last_access"])
+
+    return {"removed": removed, "bytes": sum(f["bytes"] for f in removed), "size": size}
@@ -1,15 +1,31 @@
+from __future__ import annotations
+
 import os
 import sys
-import requests
+import json
+import time
+from hashlib import sha1
 from importlib import import_module
-from hashlib import md5, sha1, sha256, sha512
+from concurrent.futures import ThreadPoolExecutor, CancelledError, as_completed
+from threading import Lock
+from typing import TYPE_CHECKING
 from warnings import warn
-from tqdm import tqdm
-from math import ceil 
-import mudata
-from mudata import MuData
 
-from .utils import sizefmt
+# requests, tqdm and mudata are only imported when data is downloaded or loaded
+# so that listing datasets and their info stays fast
+if TYPE_CHECKING:
+    from mudata import MuData
+
+from .utils import sizefmt, file_lock, remove_gzindex
+from .events import emitter
+from .mirror import mirror_url
+from .fetch import fetch, make_session
+from .verify import HASHES, hash_name, hash_file, is_verified, write_record, remove_record
+from .store import blob_path, make_dirs, link, adopt
+from .tenx import transcoded_path, find_transcoded, transcode_10x_h5
+from .partial import read_h5mu_subset
+from .repack import mmap_path, repack_for_mmap, variant_path, create_variant, find_variant, CHUNK_BYTES, MMAP_VARIANT
+from .cache import touch, prune, max_size
 
 PREFIX = "\u25A0 "
 
@@ -17,6 +33,25 @@ PREFIX = "\u25A0 "
 MAINFORMATS = ["h5mu", "h5ad", "10x_h5"]  # ordered by priority
 MAINEXTENSIONS = ["h5mu", "h5ad", "h5"]   # ordered by priority
 
+class DownloadError(RuntimeError):
+    """
+    Raised when some of the requested files could not be downloaded.
+
+    The exceptions for the individual files are available
+    as a dictionary in .errors with file names as keys.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"Failed to download {len(errors)} file(s): {', '.join(errors.keys())}")
+
+
+class ChecksumError(ValueError):
+    """
+    Raised when a downloaded file does not match its checksum from the registry.
+    """
+
+
 class MuDataSet:
     """
     Base class for all datasets.
@@ -26,54 +61,264 @@ class MuDataSet:
         self.name = None
 
     def download(
-        self, data_dir="~/mudatasets/", full=False, files=None, version=None, chunk_size=8192, check_sum=True
+        self,
+        data_dir="~/mudatasets/",
+        full=False,
+        files=None,
+        version=None,
+        chunk_size=8192,
+        check_sum=True,
+        max_workers=1,
+        segments=1,
+        force_verify=False,
+        store_dir=None,
+        cancel=None,
+        retries=3,
+        backoff=0.5,
+        timeout=60,
+        callback=None,
+        quiet=False,
+        mirror=None,
+        max_cache_size=None,
     ):
         """
         Download the files in the dataset.
+
+        With max_workers > 1, up to max_workers files are fetched
+        concurrently and a single combined progress bar is shown.
+        Failures are collected per file and raised together
+        as a DownloadError once all the other files are done.
+
+        With segments > 1, large files are split into this many
+        byte ranges that are downloaded over parallel connections
+        if the server supports Range requests.
+
+        Files that have been verified before are recorded in data_dir
+        and are not hashed again unless their size, modification time
+        or inode have changed. Use force_verify=True to hash them anyway.
+
+        Every file is downloaded while holding a lock on <file>.lock
+        so that concurrent processes do not write to the same file.
+        Time spent waiting for these locks is recorded in .lock_wait
+        in seconds for each file name.
+
+        With store_dir, or the MUDATASETS_STORE environment variable,
+        files are kept in a content-addressed store named by their checksums
+        and linked into data_dir. The store can be shared between users
+        and dataset versions so that every file is only downloaded once.
+
+        cancel can be a threading.Event that stops the transfers
+        at their next chunk once it is set. Partial files are kept
+        so that the downloads can be resumed, and CancelledError is raised.
+
+        All the files are downloaded over a shared pool of connections.
+        Failed connections, server errors (5xx and 429) and connections
+        that are closed in the middle of a file are retried up to retries times,
+        waiting backoff * 2 ** n seconds in between. timeout in seconds
+        applies to connecting and to waiting for data.
+
+        Events with timings, bytes, cache hits and retries
+        are passed to callback, see mudatasets.events.
+        Use quiet=True to silence messages and progress bars.
+
+        With mirror, or the MUDATASETS_MIRROR environment variable,
+        files are downloaded from a mirror started with serve_webpage()
+        (e.g. "http://node1:8000") and from upstream if the mirror fails.
+
+        With max_cache_size, or the MUDATASETS_MAX_CACHE_SIZE environment variable,
+        the least recently used files in data_dir are removed before downloading
+        to keep it under this size (bytes or e.g. "50G"), see mudatasets.cache.
         """
 
+        from tqdm import tqdm
+
+        pbar = None
+        pbar_lock = Lock()
+        emit = emitter(callback, dataset=self.name)
+
+        def say(message):
+            _say(message, quiet)
+
+        def transfer(finfo, data_path):
+            # Returns the digest of the downloaded file if there's a checksum to compare to
+            if mirror:
+                try:
+                    return transfer_from(mirror_url(mirror, self.name, finfo["name"], version), finfo, data_path)
+                except (ChecksumError, CancelledError):
+                    raise
+                except Exception as e:
+                    warn(f"{PREFIX}Failed to download {finfo['name']} from the mirror, will use upstream: {e}")
+            return transfer_from(finfo["url"], finfo, data_path)
+
+        def transfer_from(url, finfo, data_path):
+            if pbar is None:
+                # The size may be missing from the registry and from the response
+                size = [sizefmt(finfo["size"])] if finfo.get("size") else []
+                postfix = ", ".join([*size, finfo["name"], self.name])
+                progress = tqdm(
+                    total=finfo.get("size"),
+                    unit="B",
+                    unit_scale=True,
+                    unit_divisor=1024,
+                    postfix=postfix,
+                    disable=quiet,
+                )
+            else:
+                progress = pbar
+
+            received = 0
+            started = False
+            # Bytes of a .part file left by an earlier download,
+            # retries continue from the bytes received in this one
+            resumed = 0
+
+            def update(n):
+                nonlocal received, started
+                if cancel is not None and cancel.is_set():
+                    raise CancelledError(f"Download of {finfo['name']} has been cancelled")
+                received += n
+                started = True
+                with pbar_lock:
+                    progress.update(n)
+
+            def on_event(event, **fields):
+                nonlocal resumed
+                if event == "resume" and not started:
+                    resumed = fields["bytes"]
+                    say(f"Resuming download of {finfo['name']} after {sizefmt(resumed)}")
+                emit(event, **fields)
+
+            hashf_name = hash_name(finfo)
+            start = time.perf_counter()
+            try:
+                digest = fetch(
+                    url,
+                    data_path,
+                    size=finfo.get("size"),
+                    chunk_size=chunk_size,
+                    update=update,
+                    segments=segments,
+                    hashf=HASHES[hashf_name] if hashf_name is not None else None,
+                    session=session,
+                    timeout=timeout,
+                    emit=on_event,
+                )
+            finally:
+                if progress is not pbar:
+                    progress.close()
+            seconds = time.perf_counter() - start
+            # Bytes that were already on disk are not transferred again
+            transferred = received - resumed
+            emit(
+                "download",
+                file=finfo["name"],
+                seconds=seconds,
+                bytes=transferred,
+                bytes_per_second=transferred / seconds if seconds > 0 else None,
+                resumed=resumed,
+            )
+
+            if hashf_name is not None and digest != finfo[hashf_name]:
+                os.remove(data_path)
+                raise ChecksumError(
+                    f"Checksum of the downloaded file {finfo['name']} does not match ({hashf_name})"
+                )
+            return digest
+
         def dwnld(finfo, data_path):
-            with requests.get(finfo["url"], stream=True) as r:
-                r.raise_for_status()
-                total_length = r.headers.get("content-length")
-                if total_length:
-                    total_length = int(total_length)
-                total_chunks = ceil(total_length / chunk_size)
-                postfix = ", ".join([sizefmt(finfo["size"]), finfo["name"], self.name])
-                with open(data_path, "wb") as f:
-                    for chunk in tqdm(r.iter_content(chunk_size=chunk_size), total=total_chunks, postfix=postfix):
-                        if chunk:
-                            f.write(chunk)
-                
-
-        def chck_hsm(finfo, data_path, callback):
-            hashfs = {
-                "md5": md5,
-                "sha1": sha1,
-                "sha256": sha256,
-                "sha512": sha512,
-            }
-            hashsums = {k: k in finfo for k in hashfs.keys()}
-            hashsums = {k: v for k, v in hashsums.items() if v}
-            if len(hashsums) > 0:
-                hashf_name = list(hashsums.keys())[0]
-                hashf = hashfs[hashf_name]
-
-                hash = hashf()
-                with open(data_path, "rb") as f:
-                    for chunk in iter(lambda: f.read(chunk_size), b""):
-                        hash.update(chunk)
-                if hash.hexdigest() == finfo[hashf_name]:
-                    print(f"{PREFIX}Checksum is validated ({hashf_name}) for {finfo['name']}")
-                else:
+            hashf_name = hash_name(finfo)
+            remove_record(data_dir, data_path)
+            remove_gzindex(data_path)
+
+            if store_dir is None or hashf_name is None:
+                digest = transfer(finfo, data_path)
+            else:
+                # Files are only downloaded once to the shared store
+                # and then linked into the dataset directory
+                blob = blob_path(store_dir, hashf_name, finfo[hashf_name])
+                make_dirs(store_dir, blob)
+                with file_lock(blob):
+                    digest = None
+                    if os.path.exists(blob):
+                        # A file in the store can have been modified through one of its links
+                        start = time.perf_counter()
+                        digest = hash_file(blob, HASHES[hashf_name])
+                        ok = digest == finfo[hashf_name]
+                        emit(
+                            "verify",
+                            file=finfo["name"],
+                            seconds=time.perf_counter() - start,
+                            bytes=os.path.getsize(blob),
+                            cache="miss",
+                            ok=ok,
+                        )
+                        if not ok:
+                            warn(
+                                f"{PREFIX}Checksum of {blob} in the store does not match, "
+                                f"will re-download {finfo['name']}"
+                            )
+                            os.remove(blob)
+                            digest = None
+                    emit("store", file=finfo["name"], cache="miss" if digest is None else "hit")
+                    if digest is not None:
+                        say(f"File {finfo['name']} has been found in the store at {blob}")
+                        if pbar is not None:
+                            with pbar_lock:
+                                pbar.update(finfo.get("size") or 0)
+                    else:
+                        digest = transfer(finfo, blob)
+                        # Files in the store are shared and should not be modified
+                        os.chmod(blob, 0o444)
+                link(blob, data_path)
+
+            if hashf_name is not None:
+                write_record(data_dir, data_path, hashf_name, digest)
+
+        def chck_hsm(finfo, data_path):
+            # Returns False if the file has to be downloaded again
+            hashf_name = hash_name(finfo)
+            if hashf_name is None:
+                warn(f"No supported checksum to validate has been provided for {finfo['name']}")
+                return True
+
+            start = time.perf_counter()
+            if not force_verify and is_verified(data_dir, data_path, finfo):
+                emit("verify", file=finfo["name"], seconds=time.perf_counter() - start, bytes=0, cache="hit", ok=True)
+                say(f"Checksum has been validated before ({hashf_name}) for {finfo['name']}")
+            else:
+                digest = hash_file(data_path, HASHES[hashf_name])
+                ok = digest == finfo[hashf_name]
+                emit(
+                    "verify",
+                    file=finfo["name"],
+                    seconds=time.perf_counter() - start,
+                    bytes=os.path.getsize(data_path),
+                    cache="miss",
+                    ok=ok,
+                )
+                if not ok:
                     warn(
                         f"{PREFIX}Checksum does not match ({hashf_name}), will re-download {finfo['name']}"
                     )
-                    callback(finfo, data_path)
-            else:
-                warn(f"No supported checksum to validate has been provided for {finfo['name']}")
+                    return False
+                write_record(data_dir, data_path, hashf_name, digest)
+                say(f"Checksum is validated ({hashf_name}) for {finfo['name']}")
+
+            if store_dir is not None:
+                blob = blob_path(store_dir, hashf_name, finfo[hashf_name])
+                make_dirs(store_dir, blob)
+                with file_lock(blob):
+                    adopt(data_path, blob)
+            return True
 
         data_dir = os.path.expanduser(data_dir)
+        if store_dir is None:
+            store_dir = os.environ.get("MUDATASETS_STORE")
+        if store_dir is not None:
+            store_dir = os.path.expanduser(store_dir)
+        if mirror is None:
+            mirror = os.environ.get("MUDATASETS_MIRROR")
+        max_cache_size = max_size(max_cache_size)
 
         os.makedirs(os.path.join(data_dir, self.name), exist_ok=True)
 
@@ -135,35 +380,153 @@ class MuDataSet:
         # Download files
         priority_file_path = None
         files_avail = [f["name"] for f in data["files"]]
+        jobs = []
         for f in files:
             if f in files_avail:
                 finfo = [e for e in data["files"] if e["name"] == f][0]
                 data_path = os.path.join(os.path.join(data_dir, self.name), f)
-                if not os.path.exists(data_path):
-                    dwnld(finfo, data_path)
-                else:
-                    print(
-                        f"{PREFIX}File {finfo['name']} from {self.name} has been found at {data_path}"
-                    )
-                    if check_sum:
-                        chck_hsm(finfo, data_path, dwnld)
-                    else:
-                        warn("Will not validate the checksum of the data")
+                jobs.append((finfo, data_path))
                 if f == priority_file:
                     priority_file_path = data_path
             else:
                 warn(f"File {f} is not available for {self.name}.")
 
+        def get(finfo, data_path):
+            # Only one process downloads a file at a time,
+            # the others wait and reuse the file it has downloaded
+            if cancel is not None and cancel.is_set():
+                raise CancelledError(f"Download of {finfo['name']} has been cancelled")
+            start = time.perf_counter()
+            with file_lock(data_path):
+                waited = time.perf_counter() - start
+                self.lock_wait[finfo["name"]] = waited
+                emit("lock_wait", file=finfo["name"], seconds=waited)
+                if waited >= 1:
+                    say(f"Waited {waited:.1f}s for another process downloading {finfo['name']}")
+                if os.path.exists(data_path):
+                    if hash_name(finfo) is None or is_verified(data_dir, data_path, finfo):
+                        say(f"File {finfo['name']} has been downloaded by another process")
+                        if pbar is not None:
+                            with pbar_lock:
+                                pbar.update(finfo.get("size") or 0)
+                        return
+                dwnld(finfo, data_path)
+
+        errors = dict()
+        self.lock_wait = dict()
+
+        # Validate the files that have been downloaded before
+        to_download, to_check = [], []
+        for finfo, data_path in jobs:
+            if not os.path.exists(data_path):
+                to_download.append((finfo, data_path))
+            else:
+                say(f"File {finfo['name']} from {self.name} has been found at {data_path}")
+                if check_sum:
+                    to_check.append((finfo, data_path))
+                else:
+                    warn("Will not validate the checksum of the data")
+
+        start = time.perf_counter()
+        if len(to_check) > 0:
+            # hashlib releases the GIL so that files can be hashed in parallel
+            n_threads = min(len(to_check), os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                futures = {
+                    executor.submit(chck_hsm, finfo, data_path): (finfo, data_path)
+                    for finfo, data_path in to_check
+                }
+                for future in as_completed(futures):
+                    finfo, data_path = futures[future]
+                    try:
+                        if not future.result():
+                            to_download.append((finfo, data_path))
+                    except Exception as e:
+                        errors[finfo["name"]] = e
+
+        emit("phase", phase="verify", seconds=time.perf_counter() - start)
+
+        if max_cache_size is not None and len(to_download) > 0:
+            # Make room for the new files by their sizes in the registry
+            reserve = sum(finfo.get("size") or 0 for finfo, data_path in to_download)
+            pruned = prune(
+                max_cache_size, data_dir, reserve=reserve, keep=[data_path for finfo, data_path in jobs], emit=emit
+            )
+            if len(pruned["removed"]) > 0:
+                say(f"Removed {len(pruned['removed'])} least recently used file(s) ({sizefmt(pruned['bytes'])}) from {data_dir}")
+            if pruned["size"] + reserve > max_cache_size:
+                warn(
+                    f"{PREFIX}{data_dir} will exceed max_cache_size of {sizefmt(max_cache_size)}, "
+                    f"the remaining files are in use or requested"
+                )
+
+        # Connections and TLS sessions are reused across the files
+        start = time.perf_counter()
+        pool_size = max(1, max_workers or 1) * max(1, segments)
+        session = make_session(retries, backoff, pool_size=pool_size)
+        try:
+            if max_workers is not None and max_workers > 1 and len(to_download) > 1:
+                pbar = tqdm(
+                    total=sum(finfo.get("size") or 0 for finfo, data_path in to_download),
+                    unit="B",
+                    unit_scale=True,
+                    unit_divisor=1024,
+                    postfix=f"{len(to_download)} files, {self.name}",
+                    disable=quiet,
+                )
+                try:
+                    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                        futures = {
+                            executor.submit(get, finfo, data_path): finfo for finfo, data_path in to_download
+                        }
+                        for future in as_completed(futures):
+                            finfo = futures[future]
+                            try:
+                                future.result()
+                            except Exception as e:
+                                errors[finfo["name"]] = e
+                finally:
+                    pbar.close()
+            else:
+                for finfo, data_path in to_download:
+                    try:
+                        get(finfo, data_path)
+                    except Exception as e:
+                        errors[finfo["name"]] = e
+        finally:
+            session.close()
+            emit("phase", phase="download", seconds=time.perf_counter() - start)
+
+        touch(data_dir, [data_path for finfo, data_path in jobs if os.path.exists(data_path)])
+
+        if any(isinstance(e, CancelledError) for e in errors.values()):
+            raise CancelledError(f"Download of {self.name} has been cancelled")
+        if len(errors) > 0:
+            for fname, e in errors.items():
+                warn(f"{PREFIX}Failed to download {fname}: {e}")
+            raise DownloadError(errors)
+
         return priority_file_path, self.info
 
 
+def _dataset(name):
+    # MuDataSet instance for a dataset name, names can come from requests to the mirror
+    if not name.isidentifier() or name.startswith("_"):
+        raise ValueError(f"Dataset {name} not found")
+    try:
+        module = import_module(".datasets." + name, package=__package__)
+    except ImportError:
+        raise ValueError(f"Dataset {name} not found")
+    if not hasattr(module, "dataset"):
+        raise ValueError(f"Dataset {name} not found")
+    return module.dataset()
+
+
 # List all available datasets
 def list_datasets():
-    datasets = []
-    for file in os.listdir(os.path.join(os.path.dirname(__file__), "datasets")):
-        if file.endswith(".py") and not file.startswith("_"):
-            datasets.append(file.replace(".py", ""))
-    return datasets
+    from . import registry
+
+    return registry.list_names()
 
 
 # Load a dataset
@@ -176,10 +539,71 @@ def load(
     with_info=False,
     backed=True,
     chunk_size=8192,
+    max_workers=1,
+    segments=1,
+    force_verify=False,
+    store_dir=None,
+    cache_loaded=True,
+    transcode=True,
+    modalities=None,
+    obs_subset=None,
+    var_subset=None,
+    keys=None,
+    mmap=False,
+    variant=None,
+    cancel=None,
+    retries=3,
+    timeout=60,
+    callback=None,
+    quiet=False,
+    mirror=None,
+    max_cache_size=None,
 ) -> MuData:
     """
     Download and open the datasets returning a MuData object
+
+    Datasets that are opened with a custom loader are saved as .h5mu
+    in the dataset directory the first time they are loaded,
+    and this file is opened on the following calls.
+    Use cache_loaded=False to always run the custom loader.
+
+    Files in the 10x Genomics .h5 format are converted to .h5mu
+    the first time they are loaded with backed=True
+    so that they can be opened in backed mode.
+    Use transcode=False to read them into memory instead.
+
+    Parts of .h5mu files can be read into memory by providing
+    modalities, obs_subset and var_subset (names, integer positions,
+    boolean masks or slices) and keys, the elements to read besides X, obs
+    and var (e.g. ["obsm", "uns"]). Only the respective HDF5 groups
+    and matrix slices are read then.
+
+    With mmap=True, X and layers of .h5mu files are memory-mapped
+    so that processes on the same machine share their pages
+    in the page cache instead of holding copies. The file is rewritten
+    once with contiguous uncompressed datasets for that (<name>.mmap.h5mu).
+
+    A variant of the dataset with another chunking and compression
+    that has been created with repack_dataset() is opened with variant=.
+
+    cancel can be a threading.Event to stop downloads, retries and timeout
+    configure the HTTP requests, and mirror is the URL of a local mirror
+    started with serve_webpage(), see MuDataSet.download().
+    max_cache_size limits the size of data_dir, see mudatasets.cache.
+    For asyncio applications, see aload().
+
+    Events with the timings of every step are passed to callback,
+    see mudatasets.events. Use quiet=True to silence messages and progress bars.
     """
+    subset = dict(modalities=modalities, obs_subset=obs_subset, var_subset=var_subset, keys=keys)
+    if all(v is None for v in subset.values()):
+        subset = None
+
+    emit = emitter(callback, dataset=dataset)
+    read_opts = dict(
+        backed=backed, subset=subset, mmap=mmap, variant=variant, emit=emit, quiet=quiet, data_dir=data_dir
+    )
+    start = time.perf_counter()
 
     dataset_module = ".datasets." + dataset
     try:
@@ -189,22 +613,53 @@ def load(
 
     dset = dataset.dataset()  # MuDataSet
     data_path, data_info = dset.download(
-        data_dir=data_dir, full=full, files=files, version=version, chunk_size=chunk_size
+        data_dir=data_dir,
+        full=full,
+        files=files,
+        version=version,
+        chunk_size=chunk_size,
+        max_workers=max_workers,
+        segments=segments,
+        force_verify=force_verify,
+        store_dir=store_dir,
+        cancel=cancel,
+        retries=retries,
+        timeout=timeout,
+        callback=callback,
+        quiet=quiet,
+        mirror=mirror,
+        max_cache_size=max_cache_size,
     )
 
     mdata = None
     if data_path is not None:
         if data_path.endswith(".h5mu") or data_path.endswith(".h5ad"):
-            maybe_backed = " in backed mode" if backed else ""
-            print(f"{PREFIX}Loading {os.path.basename(data_path)}{maybe_backed}...")
-            mdata = mudata.read(data_path, backed=backed)
+            mdata = _read(data_path, **read_opts)
+        elif data_path.endswith(".h5") and backed and find_transcoded(data_path) is not None:
+            mdata = _read(find_transcoded(data_path), **read_opts)
         elif data_path.endswith(".h5"):
-            if backed:
+            if backed and not transcode:
                 warn("Dataset is in the 10X .h5 format and can't be loaded as backed.")
             try:
                 import muon as mu
-                print(f"{PREFIX}Loading {os.path.basename(data_path)}...")
-                mdata = mu.read_10x_h5(data_path)
+                if backed and transcode:
+                    # Convert to .h5mu once and open it in backed mode
+                    h5mu_path = transcoded_path(data_path)
+                    with file_lock(h5mu_path):
+                        # The .h5mu file is converted again when the .h5 file has been downloaded again
+                        if find_transcoded(data_path) is None:
+                            _say(f"Converting {os.path.basename(data_path)} to .h5mu...", quiet)
+                            convert_start = time.perf_counter()
+                            transcode_10x_h5(data_path, h5mu_path)
+                            emit("convert", path=h5mu_path, seconds=time.perf_counter() - convert_start, step="transcode")
+                    mdata = _read(h5mu_path, **read_opts)
+                else:
+                    if subset is not None:
+                        warn("Subsets can only be read from .h5mu files, the whole dataset will be loaded.")
+                    _say(f"Loading {os.path.basename(data_path)}...", quiet)
+                    read_start = time.perf_counter()
+                    mdata = mu.read_10x_h5(data_path)
+                    emit("read", path=data_path, seconds=time.perf_counter() - read_start, mode="memory")
             except ImportError as e:
                 warn("Muon is not installed and is required to load raw data. Install pysam from PyPI (`pip install muon`) or from GitHub (`pip install git+https://github.com/PMBio/muon`)")
                 if with_info:
@@ -216,15 +671,148 @@ def load(
         # Check if there's a custom loader
         custom_loader = getattr(dset, "load", None)
         if callable(custom_loader):
-            mdata = dset.load(data_dir=data_dir)
+            dset_dir = os.path.join(os.path.expanduser(data_dir), dset.name)
+            loaded_path = _loaded_path(dset, dset_dir, version)
+            if cache_loaded and os.path.exists(loaded_path):
+                mdata = _read(loaded_path, **read_opts)
+            else:
+                convert_start = time.perf_counter()
+                mdata = dset.load(data_dir=dset_dir)
+                emit("convert", path=dset_dir, seconds=time.perf_counter() - convert_start, step="loader")
+                if cache_loaded:
+                    # Convert once so that the next calls do not have to parse the files again
+                    with file_lock(loaded_path):
+                        if not os.path.exists(loaded_path):
+                            _say(f"Saving {os.path.basename(loaded_path)}...", quiet)
+                            convert_start = time.perf_counter()
+                            tmp_path = f"{loaded_path}.{os.getpid()}.tmp"
+                            mdata.write(tmp_path)
+                            os.replace(tmp_path, loaded_path)
+                            emit("convert", path=loaded_path, seconds=time.perf_counter() - convert_start, step="save")
+                    if backed or mmap or variant is not None or subset is not None:
+                        mdata = _read(loaded_path, **read_opts)
         else:
             warn("There seems to be no file with accepted extension to load (h5mu, h5ad, h5). There is no custom loader either.")
 
+    emit("phase", phase="load", seconds=time.perf_counter() - start)
     if with_info:
         return mdata, data_info
     else:
         return mdata
 
+def _say(message, quiet=False):
+    if not quiet:
+        print(f"{PREFIX}{message}")
+
+
+def _read(path, backed=True, subset=None, mmap=False, variant=None, emit=None, quiet=False, data_dir=None):
+    import mudata
+
+    if emit is None:
+        emit = emitter()
+
+    def accessed(path):
+        # Files that are read are the most recently used ones in the cache
+        if data_dir is not None:
+            touch(os.path.expanduser(data_dir), [path])
+
+    if variant is not None:
+        found = find_variant(path, variant)
+        if found is None:
+            warn(f"Variant {variant} has not been created for {os.path.basename(path)}, use repack_dataset() to create it. The original file will be loaded.")
+        else:
+            path = found
+
+    if mmap and path.endswith(".h5mu"):
+        if subset is not None and (subset["obs_subset"] is not None or subset["var_subset"] is not None):
+            warn("Subsets of observations or variables are read into memory and not memory-mapped.")
+        else:
+            # Matrices can only be mapped from contiguous uncompressed datasets
+            mapped_path = path if path.endswith(".mmap.h5mu") else mmap_path(path)
+            with file_lock(mapped_path):
+                # The mapped file is rewritten when the file has been downloaded again
+                if mapped_path != path and find_variant(path, MMAP_VARIANT) is None:
+                    _say(f"Repacking {os.path.basename(path)} for memory mapping...", quiet)
+                    start = time.perf_counter()
+                    repack_for_mmap(path, mapped_path)
+                    emit("convert", path=mapped_path, seconds=time.perf_counter() - start, step="repack")
+            _say(f"Loading {os.path.basename(mapped_path)} with memory-mapped matrices...", quiet)
+            start = time.perf_counter()
+            mdata = read_h5mu_subset(mapped_path, **(subset or {}), mmap=True)
+            emit("read", path=mapped_path, seconds=time.perf_counter() - start, mode="mmap")
+            accessed(mapped_path)
+            return mdata
+
+    start = time.perf_counter()
+    if subset is not None and path.endswith(".h5mu"):
+        _say(f"Loading a subset of {os.path.basename(path)}...", quiet)
+        mdata = read_h5mu_subset(path, **subset)
+        emit("read", path=path, seconds=time.perf_counter() - start, mode="subset")
+        accessed(path)
+        return mdata
+    if subset is not None:
+        warn("Subsets can only be read from .h5mu files, the whole dataset will be loaded.")
+    maybe_backed = " in backed mode" if backed else ""
+    _say(f"Loading {os.path.basename(path)}{maybe_backed}...", quiet)
+    mdata = mudata.read(path, backed=backed)
+    emit("read", path=path, seconds=time.perf_counter() - start, mode="backed" if backed else "memory")
+    accessed(path)
+    return mdata
+
+
+def _loaded_path(dset, dset_dir, version=None):
+    # The result of a custom loader depends on the loader itself
+    # and on the checksums of the files it reads
+    if version is None:
+        version = dset.version
+    data = [e for e in dset.data_versions if e["version"] == version][0]
+    sources = []
+    for f in data["files"]:
+        hashf_name = hash_name(f)
+        sources.append([f["name"], f[hashf_name] if hashf_name is not None else f.get("size")])
+    key = {
+        "loader_version": getattr(dset, "loader_version", None),
+        "sources": sorted(sources),
+    }
+    key = sha1(json.dumps(key).encode()).hexdigest()[:12]
+    return os.path.join(dset_dir, f"{dset.name}_{version}_loaded_{key}.h5mu")
+
+
+# Rewrite a dataset with another chunking and compression
+def repack_dataset(
+    dataset,
+    variant,
+    layout="obs",
+    compression="lzf",
+    level=None,
+    chunk_bytes=CHUNK_BYTES,
+    data_dir="~/mudatasets/",
+    version=None,
+):
+    """
+    Create a variant of a downloaded dataset with the chunk shapes
+    and the compression suited for how it is accessed,
+    and return the path to it. It is opened with load(dataset, variant=variant).
+
+    layout="obs" chunks matrices for reading cells, layout="var" for reading features,
+    sparse matrices are stored as CSR or CSC respectively.
+    compression is one of "gzip", "lzf", "blosc" or "zstd",
+    the last two require hdf5plugin.
+    """
+    mdata = load(dataset, data_dir=data_dir, version=version, backed=True)
+    path = mdata.filename if mdata is not None and mdata.isbacked else None
+    if mdata is not None and mdata.isbacked:
+        mdata.file.close()
+    if path is None:
+        raise ValueError(f"Dataset {dataset} could not be opened from a .h5mu file to be repacked")
+
+    out_path = variant_path(path, variant)
+    with file_lock(out_path):
+        print(f"{PREFIX}Repacking {os.path.basename(path)} as {os.path.basename(out_path)}...")
+        create_variant(path, variant, layout=layout, compression=compression, level=level, chunk_bytes=chunk_bytes)
+    return out_path
+
+
 # List dataset info
 def info(
     dataset
@@ -232,6 +820,13 @@ def info(
     """
     List info on a dataset and included files
     """
+    from . import registry
+
+    dset_info = registry.lookup(dataset)
+    if dset_info is not None:
+        return dset_info
+
+    # Datasets that have not been indexed yet
     dataset_module = ".datasets." + dataset
     try:
         dataset = import_module(dataset_module, package=__package__)
@@ -266,30 +861,16 @@ def list_files(
 
     return file_names
 
-def serve_webpage(port=8000):
-    import http.server
-    import socketserver
-    import tempfile
-
-    with tempfile.TemporaryDirectory() as dirpath:
-        index = os.path.join(dirpath, "index.html")
-        with open(index, mode="w") as f:
-            f.write("<html><body>\n")
-            f.write("<h1><pre>mudatasets</pre></h1>\n")
-            f.write("<p>Source code: <a href='https://github.com/gtca/mudatasets'>gtca/mudatasets</a></p></br>\n")
-            for dataset in list_datasets():
-                f.write(f"<h2>{dataset}</h2>\n")
-                f.write("<ul>")
-                for file in info(dataset)["files"]:
-                    f.write(f"<li><a href={file['url']}>{file['name']}</a> ({sizefmt(file['size'])})</li>")
-                f.write("</ul>")
-            f.write("</body></html>")
-            
-        DIRECTORY = dirpath
-        class Handler(http.server.SimpleHTTPRequestHandler):
-            def __init__(self, *args, **kwargs):
-                super().__init__(*args, directory=DIRECTORY, **kwargs)
-        
-        with socketserver.TCPServer(("", port), Handler) as httpd:
-            print("serving at port", port)
-            httpd.serve_forever()
+def serve_webpage(port=8000, data_dir="~/mudatasets/", host="", store_dir=None):
+    """
+    Serve a page listing the files of all the datasets at http://localhost:<port>/
+    and the files themselves at /<dataset>/<file> as a mirror for other machines.
+
+    Files are served from data_dir with Range support and checksum headers.
+    Missing files are downloaded from upstream once, while they are being
+    streamed to the clients. Point other machines to the mirror
+    with download(mirror="http://<host>:<port>") or MUDATASETS_MIRROR.
+    """
+    from .mirror import serve
+
+    serve(data_dir=data_dir, port=port, host=host, store_dir=store_dir)
@@ -1,5 +1,5 @@
 from ..core import MuDataSet
-from ..utils import sizefmt
+from ..utils import sizefmt, open_gzip
 
 
 class Brain9kMultiome(MuDataSet):
@@ -15,6 +15,8 @@ class Brain9kMultiome(MuDataSet):
     def __init__(self):
         self.name = "brain9k_multiome"
         self.version = "1.0"
+        # Increase when the output of .load() changes
+        self.loader_version = "2"
         self.files = [
             {
                 "name": "brain9k_multiome_processed.h5mu",
@@ -119,51 +121,46 @@ class Brain9kMultiome(MuDataSet):
 
     def load(self, data_dir="./"):
         from os import path
-        import gzip
-        from tqdm import tqdm
+        from itertools import islice
 
         import numpy as np
-        from scipy.sparse import coo_matrix, csr_matrix
+        from scipy.sparse import csr_matrix, vstack
         import pandas as pd
         from mudata import AnnData, MuData
 
-        try:
-            import polars as pl
-        except ImportError:
-            raise ImportError("polars is required for this data loader to read dense count matrices. Install it e.g. with `pip install polars`.")
-
-        try:
-            import pyarrow
-        except ImportError:
-            raise ImportError("pyarrow is required for this data loader to convert polars data frames to pandas data frames. Install it e.g. with `pip install pyarrow`.")
-
-        def read_counts(fname, sep="\t", header=True, index=True, int32=True):
-            # make a sparse matrix
-            if int32:
-                ncol = 0
-                with gzip.open(fname) as f:
-                    if header:
-                        f.readline()
-                    ncol = len(f.readline().decode().split("\t"))
+        def read_counts(fname, sep="\t", header=True, index=True, int32=True, chunk_rows=1024):
+            # The dense features x cells matrix is parsed in blocks of rows,
+            # and every block is converted to CSR right away
+            # so that only the non-zero values are kept in memory.
+            # The file is decompressed once: the header and the first row
+            # provide the names and the number of columns for all the blocks.
+            dtype = np.int32 if int32 else np.float64
+            obs_names, var_names, blocks = None, [], []
+
+            with open_gzip(fname) as f:
+                if header:
+                    obs_names = f.readline().rstrip("\n").split(sep)
+                first = f.readline()
+                ncol = len(first.split(sep)) - int(index)
+                # The header might or might not name the index column
+                if header and index and len(obs_names) == ncol + 1:
+                    obs_names = obs_names[1:]
+
+                lines = [first] + list(islice(f, chunk_rows - 1))
+                while len(lines) > 0:
                     if index:
-                        ncol = ncol - 1
-                dtypes = list(np.repeat(pl.datatypes.Int32, ncol))
-                if index:
-                    dtypes = [str] + dtypes
-                df = pl.read_csv(fname, null_values="0", sep=sep, has_header=header, dtypes=dtypes, skip_rows=int(header))
-            else:
-                df = pl.read_csv(fname, null_values="0", sep=sep, has_header=header, skip_rows=int(header))
-            df = df.fill_null(0)
-            x = csr_matrix(df[:,int(index):df.shape[1]])
-
-            # define var_names
-            if index:
-                var_names = list(df[:,0])
-
-            # define obs_names
-            if header:
-                with gzip.open(fname) as f:
-                    obs_names = f.readline().decode().split("\t")
+                        lines = [line.partition(sep) for line in lines]
+                        var_names.extend(line[0] for line in lines)
+                        lines = [line[2] for line in lines]
+                    block = np.loadtxt(lines, dtype=dtype, delimiter=sep, ndmin=2)
+                    if block.shape[1] != ncol:
+                        raise ValueError(f"Expected {ncol} columns in {fname}, found {block.shape[1]}")
+                    blocks.append(csr_matrix(block))
+                    lines = list(islice(f, chunk_rows))
+
+            # Cells are in columns in the file
+            x = vstack(blocks, format="csr").T.tocsr()
+            del blocks
 
             if index and header:
                 adata = AnnData(X=x, obs=pd.DataFrame(index=obs_names), var=pd.DataFrame(index=var_names))
@@ -182,12 +179,12 @@ class Brain9kMultiome(MuDataSet):
             modalities[m] = read_counts(fpath, sep="\t")
 
         # [atac].var
-        peaks = pl.read_csv("GSE162170_multiome_atac_consensus_peaks.txt.gz", sep="\t").to_pandas().set_index("name")
+        peaks = pd.read_csv(path.join(data_dir, "GSE162170_multiome_atac_consensus_peaks.txt.gz"), sep="\t").set_index("name")
         peaks.index.name = None
         modalities['atac'].var = peaks
 
         # .obs
-        metadata = pd.read_csv("GSE162170_multiome_cell_metadata.txt.gz", sep="\t").set_index("Cell.ID")
+        metadata = pd.read_csv(path.join(data_dir, "GSE162170_multiome_cell_metadata.txt.gz"), sep="\t").set_index("Cell.ID")
         metadata.index.name = None
         modalities['atac'].obs_names = metadata.index
         # RNA modality should have cell IDs already
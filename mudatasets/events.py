@@ -0,0 +1,121 @@
+"""
+Events emitted while datasets are downloaded, verified and loaded.
+
+Every event is a dictionary with the name of the event, the dataset,
+a timestamp and fields specific to the event:
+
+    verify     file, seconds, bytes, cache ("hit" or "miss"), ok
+    download   file, seconds, bytes, bytes_per_second, resumed
+    store      file, cache ("hit" or "miss")
+    lock_wait  file, seconds
+    retry      url, attempt, reason
+    resume     url, bytes (of a .part file that is continued)
+    probe      mirrors (url, resolved, seconds, ranges, from the fastest)
+    read       path, seconds, mode ("backed", "memory", "subset" or "mmap")
+    convert    path, seconds, step ("transcode", "loader", "save" or "repack")
+    evict      file, bytes, last_access
+    phase      phase ("verify", "download" or "load"), seconds
+
+They are passed to the callback= of load() and MuDataSet.download()
+and are logged to the "mudatasets" logger at the DEBUG level.
+A Metrics object can be used as the callback to collect them:
+
+    metrics = mds.Metrics()
+    mdata = mds.load("pbmc3k_multiome", callback=metrics, quiet=True)
+    metrics.summary()
+    metrics.to_json("metrics.json")
+"""
+
+import json
+import time
+import logging
+from threading import Lock
+
+logger = logging.getLogger("mudatasets")
+
+
+def emitter(callback=None, **context):
+    """
+    Function emitting events with the fields in context
+    to the callback and the logger.
+    """
+
+    def emit(event, **fields):
+        record = {"event": event, "time": time.time(), **context, **fields}
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(record, default=str))
+        if callback is not None:
+            callback(record)
+
+    return emit
+
+
+class Metrics:
+    """
+    Collects events, see mudatasets.events, and aggregates them.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self):
+        """
+        Time spent in every phase, bytes transferred and hashed,
+        throughput, verification and store cache hits and misses,
+        retries and time spent waiting for locks.
+        """
+        with self._lock:
+            events = list(self.events)
+
+        def total(name, field):
+            return sum(e.get(field) or 0 for e in events if e["event"] == name)
+
+        def cache(name):
+            hits = sum(1 for e in events if e["event"] == name and e.get("cache") == "hit")
+            misses = sum(1 for e in events if e["event"] == name and e.get("cache") == "miss")
+            return {"hits": hits, "misses": misses}
+
+        phases = dict()
+        for e in events:
+            if e["event"] == "phase":
+                phases[e["phase"]] = phases.get(e["phase"], 0) + e["seconds"]
+
+        download_bytes, download_seconds = total("download", "bytes"), total("download", "seconds")
+        verify_bytes, verify_seconds = total("verify", "bytes"), total("verify", "seconds")
+        return {
+            "phases": phases,
+            "download": {
+                "files": sum(1 for e in events if e["event"] == "download"),
+                "bytes": download_bytes,
+                "seconds": download_seconds,
+                "bytes_per_second": download_bytes / download_seconds if download_seconds > 0 else None,
+            },
+            "verify": {
+                **cache("verify"),
+                "bytes": verify_bytes,
+                "seconds": verify_seconds,
+                "bytes_per_second": verify_bytes / verify_seconds if verify_seconds > 0 else None,
+            },
+            "store": cache("store"),
+            "read": {"seconds": total("read", "seconds")},
+            "convert": {"seconds": total("convert", "seconds")},
+            "retries": sum(1 for e in events if e["event"] == "retry"),
+            "lock_wait": total("lock_wait", "seconds"),
+        }
+
+    def to_json(self, path=None):
+        """
+        Summary and events as JSON, written to path if it is provided.
+        """
+        with self._lock:
+            events = list(self.events)
+        data = json.dumps({"summary": self.summary(), "events": events}, indent=1, default=str)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(data)
+        return data
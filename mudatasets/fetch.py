@@ -0,0 +1,403 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from .verify import hash_file
+
+# Incomplete downloads are kept next to the destination file
+# with this suffix until they are complete
+PART_SUFFIX = ".part"
+# Progress of a segmented download is recorded next to its .part file
+SEGMENTS_SUFFIX = ".segments"
+# Files are not split into segments smaller than this
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+# Responses with these status codes are retried
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Mirrors are probed once without retries with this timeout in seconds
+PROBE_TIMEOUT = 5
+
+_seek_lock = Lock()
+
+
+def part_path(data_path):
+    return data_path + PART_SUFFIX
+
+
+def segments_path(data_path):
+    return part_path(data_path) + SEGMENTS_SUFFIX
+
+
+class IncompleteTransfer(IOError):
+    """
+    Raised when the connection is closed before the whole file has been received.
+    """
+
+
+def make_session(retries=3, backoff=0.5, pool_size=10):
+    """
+    A requests.Session with a connection pool of pool_size connections per host
+    that is shared by all the files of a download so that connections
+    and TLS sessions are reused.
+
+    Failed connections and responses with a status in RETRY_STATUSES
+    are retried up to retries times, waiting backoff * 2 ** n seconds in between.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _retrying(f, session, urls, emit=None, first=0):
+    """
+    Call f(url) again when the connection is reset, stalls or is closed
+    in the middle of a response with the retry settings of the session.
+    f is expected to resume from the data that has already been written.
+
+    Every attempt uses the next url in urls starting from urls[first],
+    so that a transfer fails over to the next mirror. Every mirror is tried
+    at least once even if the session allows fewer retries.
+    """
+    import requests
+
+    retry = session.get_adapter(urls[0]).max_retries
+    retries = max(retry.total or 0, len(urls) - 1)
+    errors = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, IncompleteTransfer)
+    if len(urls) > 1:
+        # Another mirror might have the file
+        errors += (requests.HTTPError,)
+    for attempt in range(retries + 1):
+        url = urls[(first + attempt) % len(urls)]
+        try:
+            return f(url)
+        except errors as e:
+            if attempt == retries:
+                raise
+            if emit is not None:
+                emit("retry", url=url, attempt=attempt + 1, reason=f"{type(e).__name__}: {e}")
+            # Waiting is only needed before trying the same server again
+            if attempt + 1 >= len(urls):
+                time.sleep(retry.backoff_factor * 2 ** (attempt + 1 - len(urls)))
+
+
+def probe(urls, timeout=PROBE_TIMEOUT):
+    """
+    Request the first byte of the file from every mirror concurrently.
+
+    The requests are not retried so that an unreachable or stalled mirror
+    only delays the start of the download by timeout seconds at most.
+
+    Returns a list of dictionaries with the url, the url after redirects,
+    the time to the response in seconds and whether Range requests are supported,
+    sorted from the fastest mirror. Mirrors that fail come last with inf seconds.
+    """
+    import requests
+
+    def request(url):
+        start = time.perf_counter()
+        try:
+            with session.get(url, stream=True, headers={"Range": "bytes=0-0"}, timeout=timeout) as r:
+                r.raise_for_status()
+                seconds = time.perf_counter() - start
+                return {"url": url, "resolved": r.url, "seconds": seconds, "ranges": r.status_code == 206}
+        except requests.RequestException as e:
+            return {"url": url, "resolved": url, "seconds": float("inf"), "ranges": False, "error": str(e)}
+
+    with make_session(retries=0, pool_size=len(urls)) as session:
+        if len(urls) == 1:
+            return [request(urls[0])]
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            mirrors = list(executor.map(request, urls))
+    return sorted(mirrors, key=lambda m: m["seconds"])
+
+
+def _emit_retries(r, url, emit):
+    # Requests that have been retried by urllib3 before this response
+    retries = getattr(r.raw, "retries", None)
+    if emit is None or retries is None:
+        return
+    for attempt, h in enumerate(retries.history, 1):
+        reason = f"HTTP {h.status}" if h.status is not None else str(h.error)
+        emit("retry", url=url, attempt=attempt, reason=reason)
+
+
+def partial_size(data_path):
+    """
+    Number of bytes already downloaded for data_path
+    by a previous, interrupted transfer.
+    """
+    part = part_path(data_path)
+    if not os.path.exists(part):
+        return 0
+    state = segments_path(data_path)
+    if os.path.exists(state):
+        with open(state) as f:
+            return sum(written for start, end, written in json.load(f))
+    return os.path.getsize(part)
+
+
+def fetch(
+    url, data_path, size=None, chunk_size=8192, update=None, segments=1, hashf=None, session=None, timeout=60, emit=None
+):
+    """
+    Stream the file at url to data_path.
+
+    url can also be a list of mirrors. They are probed first
+    and the fastest one is used, see probe(). When the connection
+    to a mirror fails or stalls for timeout seconds,
+    the transfer is resumed from the next one.
+
+    The data is written to a .part file first and atomically renamed
+    to data_path once the transfer is complete. If a .part file has been
+    left by an interrupted transfer, the download is resumed
+    from its last byte with an HTTP Range request.
+    If the server does not honour the Range header,
+    the file is downloaded from the beginning.
+
+    update is called with the number of bytes
+    each time a chunk has been written to disk.
+    The bytes of a .part file that are kept are reported
+    to update and as a resume event to emit.
+
+    With segments > 1 and a known size, the file is split into
+    that many byte ranges which are fetched concurrently,
+    from several mirrors if there are any, see fetch_segmented().
+
+    If a hash constructor such as hashlib.md5 is provided as hashf,
+    the digest is computed over the streamed chunks
+    and its hex representation is returned.
+
+    Requests are made with session, see make_session(),
+    and connections that are reset in the middle of the transfer
+    are resumed with a Range request. timeout is passed to requests.
+    Retries are reported as events to emit, see mudatasets.events.
+    """
+    if session is None:
+        with make_session() as session:
+            return fetch(url, data_path, size, chunk_size, update, segments, hashf, session, timeout, emit)
+
+    part = part_path(data_path)
+    state = segments_path(data_path)
+
+    urls = [url] if isinstance(url, str) else list(url)
+    mirrors = None
+    if len(urls) > 1:
+        mirrors = probe(urls, min(timeout, PROBE_TIMEOUT))
+        if emit is not None:
+            emit("probe", mirrors=mirrors)
+        urls = [m["url"] for m in mirrors]
+
+    if segments > 1 and size is not None and size >= 2 * MIN_SEGMENT_SIZE:
+        # A .part file from a streamed transfer is resumed by streaming
+        if os.path.exists(state) or not os.path.exists(part):
+            if fetch_segmented(urls, data_path, size, segments, chunk_size, update, session, timeout, emit, mirrors):
+                # Segments arrive out of order and are hashed once complete
+                return hash_file(data_path, hashf) if hashf is not None else None
+
+    if os.path.exists(state):
+        # A segmented .part file has holes and cannot be resumed by streaming
+        os.remove(state)
+        if os.path.exists(part):
+            os.remove(part)
+
+    # Progress is reported again from the start of the file on every attempt
+    reported = 0
+
+    def progress(n):
+        nonlocal reported
+        reported += n
+        if update is not None:
+            update(n)
+
+    def attempt(url):
+        if reported > 0:
+            progress(-reported)
+        return _stream(url, data_path, size, chunk_size, progress, hashf, session, timeout, emit)
+
+    return _retrying(attempt, session, urls, emit)
+
+
+def _stream(url, data_path, size, chunk_size, update, hashf, session, timeout, emit=None):
+    part = part_path(data_path)
+    offset = partial_size(data_path)
+    if size is not None and offset > size:
+        # The partial file cannot belong to this file version
+        os.remove(part)
+        offset = 0
+
+    headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+    with session.get(url, stream=True, headers=headers, timeout=timeout) as r:
+        _emit_retries(r, url, emit)
+        if offset > 0 and r.status_code == 416:
+            # Range not satisfiable: nothing is left to download
+            if size is None or offset == size:
+                if emit is not None:
+                    emit("resume", url=url, bytes=offset)
+                if update is not None:
+                    update(offset)
+                os.replace(part, data_path)
+                return hash_file(data_path, hashf) if hashf is not None else None
+            os.remove(part)
+            return _stream(url, data_path, size, chunk_size, update, hashf, session, timeout, emit)
+        r.raise_for_status()
+
+        if offset > 0 and r.status_code == 206:
+            mode = "ab"
+            if emit is not None:
+                emit("resume", url=url, bytes=offset)
+            if update is not None:
+                update(offset)
+        else:
+            mode = "wb"
+            offset = 0
+
+        # Servers may not send the length, e.g. for compressed responses,
+        # the size from the registry is checked then
+        expected = size
+        if r.headers.get("content-length") and "content-encoding" not in r.headers:
+            expected = offset + int(r.headers["content-length"])
+
+        hash = None
+        if hashf is not None:
+            # Only the part that is already on disk has to be read
+            hash = hash_file(part, hashf, digest=False) if offset > 0 else hashf()
+
+        with open(part, mode) as f:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    if hash is not None:
+                        hash.update(chunk)
+                    if update is not None:
+                        update(len(chunk))
+
+    received = os.path.getsize(part)
+    if expected is not None and received < expected:
+        # Keep the .part file so that the next call can resume
+        raise IncompleteTransfer(
+            f"Connection closed after {received} out of {expected} bytes of {os.path.basename(data_path)}"
+        )
+
+    os.replace(part, data_path)
+    return hash.hexdigest() if hash is not None else None
+
+
+def fetch_segmented(
+    url, data_path, size, segments, chunk_size=8192, update=None, session=None, timeout=60, emit=None, mirrors=None
+):
+    """
+    Download the file at url to data_path as byte range segments
+    fetched concurrently over a pool of connections.
+
+    url can also be a list of mirrors, then the segments are spread
+    over all the mirrors supporting Range requests, and a segment
+    continues from another mirror if its connection fails.
+    mirrors are the results of probe() if the mirrors have been probed already.
+
+    The .part file is preallocated to the full size, and every segment
+    is written at its own offset. The number of bytes written
+    for each segment is recorded in a .segments file
+    so that an interrupted transfer can be resumed.
+
+    Returns False without downloading anything
+    if the server does not support Range requests.
+    """
+    if session is None:
+        with make_session(pool_size=segments) as session:
+            return fetch_segmented(url, data_path, size, segments, chunk_size, update, session, timeout, emit, mirrors)
+
+    part = part_path(data_path)
+    state = segments_path(data_path)
+
+    # Follow redirects once and check that byte ranges are served
+    if mirrors is None:
+        mirrors = probe([url] if isinstance(url, str) else list(url), min(timeout, PROBE_TIMEOUT))
+    sources = [m["resolved"] for m in mirrors if m["ranges"]]
+    if len(sources) == 0:
+        return False
+
+    ranges = None
+    if os.path.exists(state) and os.path.exists(part) and os.path.getsize(part) == size:
+        with open(state) as f:
+            ranges = [list(e) for e in json.load(f)]
+    if ranges is None:
+        step = -(-size // segments)
+        ranges = [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+        with open(part, "wb") as f:
+            f.truncate(size)
+
+    def save_state():
+        with open(state, "w") as f:
+            json.dump(ranges, f)
+
+    resumed = sum(written for start, end, written in ranges)
+    if resumed > 0 and emit is not None:
+        emit("resume", url=sources[0], bytes=resumed)
+    if update is not None:
+        update(resumed)
+
+    def get_range(url, segment, fd):
+        start, end, written = segment
+        if start + written > end:
+            return
+        headers = {"Range": f"bytes={start + written}-{end}"}
+        with session.get(url, stream=True, headers=headers, timeout=timeout) as r:
+            _emit_retries(r, url, emit)
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise IOError(f"Server did not return the requested range {headers['Range']}")
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    chunk = chunk[: end + 1 - start - segment[2]]
+                    _pwrite(fd, chunk, start + segment[2])
+                    segment[2] += len(chunk)
+                    if update is not None:
+                        update(len(chunk))
+        if start + segment[2] <= end:
+            raise IncompleteTransfer(f"Connection closed before the end of the range {headers['Range']}")
+
+    def get_segment(i, segment, fd):
+        # Every retry continues from the last byte written for the segment
+        _retrying(lambda url: get_range(url, segment, fd), session, sources, emit, first=i)
+
+    save_state()
+    fd = os.open(part, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            futures = [executor.submit(get_segment, i, segment, fd) for i, segment in enumerate(ranges)]
+            for future in futures:
+                future.result()
+    finally:
+        os.close(fd)
+        save_state()
+
+    os.remove(state)
+    os.replace(part, data_path)
+    return True
+
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        while len(data) > 0:
+            n = os.pwrite(fd, data, offset)
+            data, offset = data[n:], offset + n
+    else:
+        # No positional writes on Windows
+        with _seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while len(data) > 0:
+                n = os.write(fd, data)
+                data = data[n:]
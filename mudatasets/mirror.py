@@ -0,0 +1,251 @@
+"""
+Local mirror of the datasets.
+
+Files are served from data_dir at /<dataset>/<file> with Range support
+and with their checksums from the registry in X-Checksum-<hash> and ETag headers.
+Files that are not in data_dir yet are downloaded from upstream once
+and streamed to all the clients requesting them while they are downloaded.
+
+Clients point MuDataSet.download() and load() to the mirror with mirror=
+or with the MUDATASETS_MIRROR environment variable.
+"""
+
+import os
+import re
+import time
+import html
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from urllib.parse import quote, unquote, urlsplit, parse_qs
+
+from .fetch import part_path
+from .utils import sizefmt
+from .verify import HASHES, hash_name, is_verified
+
+# Files are sent in blocks of this size
+BLOCK_SIZE = 1024 * 1024
+# Interval to check for new data while a file is being downloaded
+POLL_INTERVAL = 0.05
+
+
+def mirror_url(mirror, dataset, fname, version=None):
+    url = f"{mirror.rstrip('/')}/{quote(dataset)}/{quote(fname)}"
+    if version is not None:
+        url += f"?version={quote(version)}"
+    return url
+
+
+class Mirror:
+    """
+    Files of data_dir and the downloads from upstream
+    that fill the files missing in it.
+    """
+
+    def __init__(self, data_dir="~/mudatasets/", store_dir=None, max_workers=4):
+        self.data_dir = os.path.expanduser(data_dir)
+        self.store_dir = store_dir
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.fills = dict()
+        self.lock = Lock()
+
+    def lookup(self, dataset, fname, version=None):
+        """
+        MuDataSet and file info for a file of a dataset, or None if there's no such file.
+        """
+        from .core import _dataset
+
+        try:
+            dset = _dataset(dataset)
+        except ValueError:
+            return None, None
+        if version is None:
+            version = dset.version
+        for data in dset.data_versions:
+            if data["version"] == version:
+                for finfo in data["files"]:
+                    if finfo["name"] == fname:
+                        return dset, finfo
+        return None, None
+
+    def fill(self, dset, finfo, version=None):
+        """
+        Download a file to data_dir in the background, once for all the clients.
+        Returns the future of the download.
+        """
+        data_path = self.path(dset, finfo)
+        with self.lock:
+            future = self.fills.get(data_path)
+            if future is None or future.done():
+                future = self.executor.submit(
+                    dset.download,
+                    data_dir=self.data_dir,
+                    files=[finfo["name"]],
+                    version=version,
+                    store_dir=self.store_dir,
+                    # The mirror itself always downloads from upstream
+                    mirror="",
+                    quiet=True,
+                )
+                self.fills[data_path] = future
+        return future
+
+    def path(self, dset, finfo):
+        return os.path.join(self.data_dir, dset.name, finfo["name"])
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def do_HEAD(self):
+        self.serve(body=False)
+
+    def do_GET(self):
+        self.serve(body=True)
+
+    def send_empty(self, status, headers=None):
+        self.send_response(status)
+        for k, v in (headers or dict()).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def serve(self, body=True):
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+        if len(parts) == 0:
+            return self.serve_index(body)
+        if len(parts) != 2:
+            return self.send_empty(404)
+
+        version = parse_qs(url.query).get("version", [None])[0]
+        mirror = self.server.mirror
+        dset, finfo = mirror.lookup(*parts, version=version)
+        if finfo is None:
+            return self.send_empty(404)
+
+        data_path = mirror.path(dset, finfo)
+        if os.path.exists(data_path) and is_verified(mirror.data_dir, data_path, finfo):
+            future = None
+        else:
+            future = mirror.fill(dset, finfo, version)
+
+        f = self.open(data_path, future)
+        if f is None:
+            error = future.exception() if future is not None else None
+            self.log_error("Failed to fetch %s: %s", self.path, error)
+            return self.send_empty(502)
+
+        with f:
+            size = finfo.get("size")
+            if future is None or future.done():
+                size = os.fstat(f.fileno()).st_size
+            self.send_file(f, size, finfo, future, body)
+
+    def open(self, data_path, future):
+        # The file itself, or the .part file while it is being downloaded
+        part = part_path(data_path)
+        while True:
+            done = future is None or future.done()
+            if done and os.path.exists(data_path):
+                return open(data_path, "rb")
+            if done:
+                return None
+            if os.path.exists(part):
+                try:
+                    # The open file stays valid when it is renamed once complete
+                    return open(part, "rb")
+                except FileNotFoundError:
+                    continue
+            time.sleep(POLL_INTERVAL)
+
+    def send_file(self, f, size, finfo, future, body):
+        start, end, status = 0, None if size is None else size - 1, 200
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if match and size is not None:
+            start = int(match.group(1))
+            if start >= size:
+                return self.send_empty(416, {"Content-Range": f"bytes */{size}"})
+            if match.group(2):
+                end = min(int(match.group(2)), size - 1)
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        if size is not None:
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+        else:
+            # The end of the file is signalled by closing the connection
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        for name in HASHES.keys():
+            if name in finfo:
+                self.send_header(f"X-Checksum-{name.capitalize()}", finfo[name])
+        if hash_name(finfo) is not None:
+            self.send_header("ETag", f'"{finfo[hash_name(finfo)]}"')
+        self.end_headers()
+        if not body:
+            return
+
+        # Follow the file while it is being downloaded
+        f.seek(start)
+        pos = start
+        while end is None or pos <= end:
+            n = BLOCK_SIZE if end is None else min(BLOCK_SIZE, end + 1 - pos)
+            data = f.read(n)
+            if len(data) > 0:
+                self.wfile.write(data)
+                pos += len(data)
+            elif future is None or future.done():
+                break
+            else:
+                time.sleep(POLL_INTERVAL)
+        if end is not None and pos <= end:
+            # Incomplete response, the client resumes or retries
+            self.close_connection = True
+
+    def serve_index(self, body=True):
+        from .core import list_datasets, info
+
+        lines = ["<html><body>", "<h1><pre>mudatasets</pre></h1>"]
+        lines.append("<p>Source code: <a href='https://github.com/gtca/mudatasets'>gtca/mudatasets</a></p></br>")
+        for dataset in list_datasets():
+            lines.append(f"<h2>{html.escape(dataset)}</h2>")
+            lines.append("<ul>")
+            for file in info(dataset)["files"]:
+                local = f"/{quote(dataset)}/{quote(file['name'])}"
+                size = f" ({sizefmt(file['size'])})" if file.get("size") else ""
+                urls = [file["url"]] if isinstance(file["url"], str) else file["url"]
+                upstream = " ".join(f"[<a href='{html.escape(url)}'>upstream</a>]" for url in urls)
+                lines.append(f"<li><a href='{local}'>{html.escape(file['name'])}</a>{size} {upstream}</li>")
+            lines.append("</ul>")
+        lines.append("</body></html>")
+        content = "\n".join(lines).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if body:
+            self.wfile.write(content)
+
+
+def serve(data_dir="~/mudatasets/", port=8000, host="", store_dir=None, quiet=False):
+    """
+    Serve the files of data_dir as a mirror with an index page at /
+    until the process is interrupted.
+    """
+    httpd = ThreadingHTTPServer((host, port), MirrorHandler)
+    httpd.daemon_threads = True
+    httpd.mirror = Mirror(data_dir, store_dir=store_dir)
+    httpd.quiet = quiet
+    with httpd:
+        print(f"serving {httpd.mirror.data_dir} at port {httpd.server_address[1]}")
+        httpd.serve_forever()
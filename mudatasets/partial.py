@@ -0,0 +1,256 @@
+"""
+Read parts of .h5mu files.
+
+Only the HDF5 groups of the requested modalities and elements are opened,
+and matrices are only read for the requested observations and variables.
+"""
+
+from warnings import warn
+
+# Elements of AnnData objects besides X, obs and var
+ELEMENTS = ["layers", "obsm", "varm", "obsp", "varp", "uns", "raw"]
+
+
+def _io():
+    try:
+        from anndata.io import read_elem, sparse_dataset
+    except ImportError:
+        from anndata.experimental import read_elem, sparse_dataset
+    return read_elem, sparse_dataset
+
+
+def _index(group):
+    # Only the index of a data frame, without reading its columns
+    read_elem, _ = _io()
+    import pandas as pd
+
+    return pd.Index(read_elem(group[group.attrs["_index"]]))
+
+
+def _positions(index, subset):
+    """
+    Sorted integer positions in index for a subset given as names,
+    integer positions, a boolean mask or a slice. None selects everything.
+    """
+    import numpy as np
+
+    if subset is None:
+        return None
+    if isinstance(subset, slice):
+        return np.arange(len(index))[subset]
+    if isinstance(subset, str):
+        subset = [subset]
+    subset = np.asarray(subset)
+    if subset.dtype == bool:
+        return np.flatnonzero(subset)
+    if np.issubdtype(subset.dtype, np.integer):
+        return np.unique(np.arange(len(index))[subset])
+    pos = index.get_indexer(subset)
+    if (pos < 0).any():
+        missing = ", ".join(map(str, subset[pos < 0][:5]))
+        raise KeyError(f"Not found in the file: {missing}")
+    return np.unique(pos)
+
+
+def _as_indexer(pos):
+    # Consecutive positions are read as a slice which is faster in h5py
+    if pos is None:
+        return slice(None)
+    if len(pos) > 0 and pos[-1] - pos[0] == len(pos) - 1:
+        return slice(int(pos[0]), int(pos[-1]) + 1)
+    return pos
+
+
+def _take(elem, rows=None, cols=None):
+    """
+    Read an element restricted to the sorted positions in rows and cols.
+    """
+    read_elem, sparse_dataset = _io()
+    import h5py
+
+    encoding = elem.attrs.get("encoding-type", "")
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode()
+
+    if encoding in ("csr_matrix", "csc_matrix"):
+        return sparse_dataset(elem)[_as_indexer(rows), _as_indexer(cols)]
+
+    if encoding == "dataframe":
+        df = read_elem(elem)
+        return df if rows is None else df.iloc[rows]
+
+    if isinstance(elem, h5py.Dataset) and elem.ndim > 0:
+        x = elem[_as_indexer(rows)]
+        if cols is not None and x.ndim > 1:
+            x = x[:, cols]
+        return x
+
+    return read_elem(elem)
+
+
+def _map(elem):
+    """
+    Memory-map a dense or sparse matrix without reading it,
+    or return None if it is chunked or compressed.
+    """
+    import h5py
+    from scipy.sparse import csr_matrix, csc_matrix
+    from .repack import is_mappable, memmap
+
+    encoding = elem.attrs.get("encoding-type", "")
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode()
+
+    if encoding in ("csr_matrix", "csc_matrix"):
+        parts = [elem[k] for k in ("data", "indices", "indptr")]
+        if all(is_mappable(p) for p in parts):
+            matrix = csr_matrix if encoding == "csr_matrix" else csc_matrix
+            return matrix(tuple(memmap(p) for p in parts), shape=tuple(elem.attrs["shape"]), copy=False)
+    elif isinstance(elem, h5py.Dataset) and elem.ndim == 2 and is_mappable(elem):
+        return memmap(elem)
+    return None
+
+
+def _take_or_map(elem, rows=None, cols=None, mmap=False):
+    if mmap and rows is None and cols is None:
+        x = _map(elem)
+        if x is not None:
+            return x
+        warn(f"{elem.name} is chunked or compressed and will be read into memory.")
+    return _take(elem, rows, cols)
+
+
+def _read_mapping(group, key, keys, rows=None, cols=None, square=False, mmap=False):
+    # obsm, varm, obsp, varp and layers
+    if key not in group or (keys is not None and key not in keys):
+        return None
+    result = dict()
+    for name, elem in group[key].items():
+        if square:
+            result[name] = _take(elem, rows, rows)
+        else:
+            result[name] = _take_or_map(elem, rows, cols, mmap=mmap)
+    return result
+
+
+def _read_modality(group, obs_names=None, var_names=None, keys=None, mmap=False):
+    read_elem, _ = _io()
+    import numpy as np
+    from anndata import AnnData
+
+    # Only the observations and variables present in this modality
+    rows, cols = None, None
+    if obs_names is not None:
+        rows = _index(group["obs"]).get_indexer(obs_names)
+        rows = np.unique(rows[rows >= 0])
+    if var_names is not None:
+        cols = _index(group["var"]).get_indexer(var_names)
+        cols = np.unique(cols[cols >= 0])
+
+    obs = _take(group["obs"], rows)
+    var = _take(group["var"], cols)
+    X = _take_or_map(group["X"], rows, cols, mmap=mmap) if "X" in group else None
+
+    adata = AnnData(
+        X=X,
+        obs=obs,
+        var=var,
+        layers=_read_mapping(group, "layers", keys, rows, cols, mmap=mmap),
+        obsm=_read_mapping(group, "obsm", keys, rows),
+        varm=_read_mapping(group, "varm", keys, cols),
+        obsp=_read_mapping(group, "obsp", keys, rows, square=True),
+        varp=_read_mapping(group, "varp", keys, cols, square=True),
+        uns=read_elem(group["uns"]) if "uns" in group and (keys is None or "uns" in keys) else None,
+    )
+
+    if "raw" in group and keys is not None and "raw" in keys:
+        raw = group["raw"]
+        adata.raw = AnnData(X=_take(raw["X"], rows), obs=obs, var=_take(raw["var"]))
+
+    return adata
+
+
+def read_h5mu_subset(path, modalities=None, obs_subset=None, var_subset=None, keys=None, mmap=False):
+    """
+    Read a part of a .h5mu file into memory.
+
+    Parameters
+    ----------
+    path
+        Path to the .h5mu file
+    modalities
+        Names of the modalities to read, all of them by default
+    obs_subset, var_subset
+        Observations or variables to read, as names, integer positions,
+        a boolean mask or a slice over mdata.obs_names / mdata.var_names.
+        They are returned in the order of the file.
+    keys
+        Elements to read besides X, obs and var, e.g. ["obsm", "uns"].
+        All the elements except raw are read by default.
+    mmap
+        Memory-map X and layers instead of reading them
+        if they are stored contiguously and uncompressed,
+        and neither obs_subset nor var_subset are provided.
+    """
+    import h5py
+    from mudata import MuData
+
+    if isinstance(modalities, str):
+        modalities = [modalities]
+    if isinstance(keys, str):
+        keys = [keys]
+    if keys is None:
+        keys = [k for k in ELEMENTS if k != "raw"]
+
+    with h5py.File(path, "r") as f:
+        mod_order = list(f.attrs.get("mod-order", f["mod"].keys()))
+        mod_order = [m.decode() if isinstance(m, bytes) else m for m in mod_order]
+        if modalities is None:
+            modalities = mod_order
+        missing = [m for m in modalities if m not in f["mod"]]
+        if len(missing) > 0:
+            raise KeyError(f"Modalities not found in {path}: {', '.join(missing)}")
+
+        obs_index = _index(f["obs"])
+        obs_pos = _positions(obs_index, obs_subset)
+        obs_names = obs_index[obs_pos] if obs_pos is not None else None
+
+        var_index = _index(f["var"])
+        var_pos = _positions(var_index, var_subset)
+        var_names = var_index[var_pos] if var_pos is not None else None
+
+        mods = {
+            m: _read_modality(f["mod"][m], obs_names=obs_names, var_names=var_names, keys=keys, mmap=mmap)
+            for m in modalities
+        }
+        mdata = MuData(mods)
+
+        # Global annotations for the observations and variables that have been read
+        skipped = [m for m in mod_order if m not in modalities]
+        for axis, index in (("obs", obs_index), ("var", var_index)):
+            if not index.is_unique:
+                continue
+            names = getattr(mdata, f"{axis}_names")
+            pos = index.get_indexer(names)
+            if (pos < 0).any():
+                continue
+            df = _take(f[axis]).iloc[pos]
+            df = df.loc[:, [c for c in df.columns if c.split(":")[0] not in skipped]]
+            setattr(mdata, axis, df)
+            for key, square in ((f"{axis}m", False), (f"{axis}p", True)):
+                if key in f and key in keys:
+                    order = pos.argsort()
+                    inverse = order.argsort()
+                    sorted_pos = pos[order]
+                    for name, elem in f[key].items():
+                        value = _take(elem, sorted_pos, sorted_pos if square else None)
+                        value = value.iloc[inverse] if hasattr(value, "iloc") else value[inverse]
+                        if square:
+                            value = value[:, inverse]
+                        getattr(mdata, key)[name] = value
+
+        if "uns" in f and "uns" in keys:
+            read_elem, _ = _io()
+            mdata.uns = read_elem(f["uns"])
+
+    return mdata
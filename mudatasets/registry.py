@@ -0,0 +1,76 @@
+"""
+Index of the datasets and their files.
+
+Listing datasets and looking up their metadata only needs the index
+and does not require importing every dataset module.
+After adding or changing a dataset, regenerate the index with
+
+    python -m mudatasets.registry
+"""
+
+import os
+import json
+from copy import deepcopy
+from functools import lru_cache
+from importlib import import_module
+
+DATASETS_DIR = os.path.join(os.path.dirname(__file__), "datasets")
+INDEX_PATH = os.path.join(DATASETS_DIR, "index.json")
+
+
+def _dataset_modules():
+    modules = []
+    for file in sorted(os.listdir(DATASETS_DIR)):
+        if file.endswith(".py") and not file.startswith("_"):
+            modules.append(file.replace(".py", ""))
+    return modules
+
+
+def build_index(path=INDEX_PATH):
+    """
+    Import every dataset module and write the info of all datasets to the index.
+    """
+    index = dict()
+    for name in _dataset_modules():
+        dataset = import_module(f"{__package__}.datasets.{name}")
+        index[name] = dataset.dataset().info
+    with open(path, "w") as f:
+        json.dump(index, f, indent=2)
+        f.write("\n")
+    _read_index.cache_clear()
+    return index
+
+
+@lru_cache(maxsize=None)
+def _read_index():
+    try:
+        with open(INDEX_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def list_names():
+    """
+    Names of all the datasets.
+    """
+    index = _read_index()
+    if index is None:
+        return _dataset_modules()
+    return list(index.keys())
+
+
+def lookup(dataset):
+    """
+    Info on a dataset as provided by its module,
+    or None if the dataset is not in the index.
+    """
+    index = _read_index()
+    if index is None or dataset not in index:
+        return None
+    return deepcopy(index[dataset])
+
+
+if __name__ == "__main__":
+    index = build_index()
+    print(f"Indexed {len(index)} datasets in {INDEX_PATH}")
@@ -0,0 +1,318 @@
+"""
+Rewrite downloaded .h5mu files with a different storage layout.
+"""
+
+import os
+import json
+
+from .utils import file_lock
+
+# Numeric datasets are copied in blocks of about this size
+BLOCK_SIZE = 64 * 1024 * 1024
+# Default size of the chunks of rechunked datasets
+CHUNK_BYTES = 64 * 1024
+# Variants of the files are recorded in this file inside the dataset directory
+VARIANTS_FILE = ".variants.json"
+# Sparse X and layers are stored compressed along the axis read with each layout
+SPARSE_FORMATS = {"obs": "csr", "var": "csc"}
+# Name of the variant written by repack_for_mmap()
+MMAP_VARIANT = "mmap"
+# Compression filters available for variants,
+# blosc and zstd are provided by hdf5plugin
+CODECS = ["gzip", "lzf", "blosc", "zstd"]
+
+
+def mmap_path(path):
+    return variant_path(path, MMAP_VARIANT)
+
+
+def _copy_dataset(src, parent, name, layout=None, chunk_bytes=CHUNK_BYTES, **kwargs):
+    # src is an HDF5 dataset or a numpy array
+    import numpy as np
+
+    if src.dtype.kind not in "biuf" or src.ndim == 0:
+        # Strings and scalars are small, they are copied as they are
+        src.file.copy(src, parent, name=name)
+        return
+    if layout is not None and src.size > 0:
+        kwargs["chunks"] = _chunks(src.shape, src.dtype.itemsize, layout, chunk_bytes)
+    dst = parent.create_dataset(name, shape=src.shape, dtype=src.dtype, **kwargs)
+    if src.size > 0:
+        row_size = max(1, src.dtype.itemsize * int(np.prod(src.shape[1:])))
+        step = max(1, BLOCK_SIZE // row_size)
+        for start in range(0, src.shape[0], step):
+            dst[start : start + step] = src[start : start + step]
+    for k, v in getattr(src, "attrs", dict()).items():
+        dst.attrs[k] = v
+
+
+def _sparse_format(group):
+    # "csr" or "csc" for sparse matrices as written by anndata, None otherwise
+    encoding = group.attrs.get("encoding-type", group.attrs.get("h5sparse_format"))
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode()
+    if encoding in ("csr_matrix", "csc_matrix", "csr", "csc"):
+        return encoding[:3]
+    return None
+
+
+def _is_matrix(group):
+    # X and layers of AnnData objects, not obsm, varm, obsp or varp
+    parts = group.name.split("/")
+    return parts[-1] == "X" or (len(parts) > 1 and parts[-2] == "layers")
+
+
+def _convert_sparse(src, parent, name, format, **kwargs):
+    """
+    Write a sparse matrix in the CSR or CSC format,
+    the matrix is converted in memory.
+    """
+    from scipy.sparse import csr_matrix, csc_matrix
+
+    shape = tuple(src.attrs.get("shape", src.attrs.get("h5sparse_shape")))
+    cls = csr_matrix if _sparse_format(src) == "csr" else csc_matrix
+    x = cls((src["data"][:], src["indices"][:], src["indptr"][:]), shape=shape)
+    x = x.tocsr() if format == "csr" else x.tocsc()
+    x.sort_indices()
+
+    dst = parent.create_group(name)
+    for k, v in src.attrs.items():
+        dst.attrs[k] = v
+    if "encoding-type" in dst.attrs:
+        dst.attrs["encoding-type"] = f"{format}_matrix"
+    if "h5sparse_format" in dst.attrs:
+        dst.attrs["h5sparse_format"] = format
+    for key in ("data", "indices", "indptr"):
+        _copy_dataset(getattr(x, key).astype(src[key].dtype, copy=False), dst, key, **kwargs)
+
+
+def _copy_group(src, dst, **kwargs):
+    import h5py
+
+    for k, v in src.attrs.items():
+        dst.attrs[k] = v
+    for name, obj in src.items():
+        if isinstance(obj, h5py.Group):
+            format = SPARSE_FORMATS.get(kwargs.get("layout"))
+            if format is not None and _sparse_format(obj) not in (None, format) and _is_matrix(obj):
+                _convert_sparse(obj, dst, name, format, **kwargs)
+            else:
+                _copy_group(obj, dst.create_group(name), **kwargs)
+        else:
+            _copy_dataset(obj, dst, name, **kwargs)
+
+
+def _chunks(shape, itemsize, layout, chunk_bytes=CHUNK_BYTES):
+    """
+    Chunk shape of about chunk_bytes for a dataset,
+    spanning whole rows for layout="obs" and whole columns for layout="var".
+
+    1D datasets such as the data and indices of sparse matrices
+    are split into consecutive chunks in both cases,
+    the matrices are stored as CSR or CSC for that, see repack().
+    """
+    import numpy as np
+
+    n = max(1, chunk_bytes // itemsize)
+    if len(shape) == 1:
+        return (min(shape[0], n),)
+    if layout == "obs":
+        rows = max(1, n // int(np.prod(shape[1:])))
+        return (min(shape[0], rows), *shape[1:])
+    if layout == "var":
+        cols = max(1, n // (shape[0] * int(np.prod(shape[2:]))))
+        return (shape[0], min(shape[1], cols), *shape[2:])
+    raise ValueError(f"Unknown layout {layout}, use 'obs' or 'var'")
+
+
+def _codec(compression, level=None):
+    """
+    h5py.Group.create_dataset() arguments for a compression filter.
+    """
+    if compression is None:
+        return dict()
+    if compression == "gzip":
+        return dict(compression="gzip", compression_opts=4 if level is None else level, shuffle=True)
+    if compression == "lzf":
+        return dict(compression="lzf", shuffle=True)
+    if compression in ("blosc", "zstd"):
+        try:
+            import hdf5plugin
+        except ImportError:
+            raise ImportError(f"hdf5plugin is required for {compression} compression (`pip install hdf5plugin`)")
+        if compression == "blosc":
+            return dict(hdf5plugin.Blosc(cname="zstd", clevel=5 if level is None else level, shuffle=hdf5plugin.Blosc.SHUFFLE))
+        return dict(hdf5plugin.Zstd(clevel=3 if level is None else level))
+    raise ValueError(f"Unknown compression {compression}, available ones are: {', '.join(CODECS)}")
+
+
+def repack(path, out_path, **kwargs):
+    """
+    Copy an HDF5 file to out_path creating numeric datasets
+    with the h5py.Group.create_dataset() arguments in kwargs
+    such as compression.
+    With layout="obs" or layout="var", the datasets are chunked
+    for reading rows or columns, in chunks of about chunk_bytes,
+    and sparse X and layers are written as CSR or CSC matrices respectively.
+
+    Without any arguments, datasets are stored contiguously and uncompressed.
+    The user block, where .h5mu files keep their format version, is preserved.
+    """
+    import h5py
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with h5py.File(path, "r") as src:
+        userblock_size = src.userblock_size
+        with h5py.File(tmp_path, "w", userblock_size=userblock_size) as dst:
+            _copy_group(src, dst, **kwargs)
+
+    if userblock_size > 0:
+        with open(path, "rb") as src, open(tmp_path, "r+b") as dst:
+            dst.write(src.read(userblock_size))
+
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def repack_for_mmap(path, out_path=None):
+    """
+    Rewrite a .h5mu file with contiguous, uncompressed datasets
+    so that its matrices can be memory-mapped, see load(mmap=True).
+    The file is recorded as the "mmap" variant, see find_variant().
+    """
+    if out_path is None:
+        out_path = mmap_path(path)
+    repack(path, out_path)
+    record_variant(path, MMAP_VARIANT, out_path)
+    return out_path
+
+
+def is_mappable(dataset):
+    """
+    Check if a numeric HDF5 dataset is stored contiguously without filters
+    so that it can be accessed with numpy.memmap.
+    """
+    return (
+        dataset.dtype.kind in "biuf"
+        and dataset.chunks is None
+        and dataset.compression is None
+        and (dataset.size == 0 or dataset.id.get_offset() is not None)
+    )
+
+
+def memmap(dataset):
+    """
+    Map an HDF5 dataset into memory without reading it.
+
+    Pages are read from the file when they are accessed
+    and are shared with all the processes mapping the same file.
+    """
+    import numpy as np
+
+    if dataset.size == 0:
+        return np.empty(dataset.shape, dtype=dataset.dtype)
+    return np.memmap(
+        dataset.file.filename,
+        dtype=dataset.dtype,
+        mode="r",
+        offset=dataset.id.get_offset(),
+        shape=dataset.shape,
+        order="C",
+    )
+
+
+def variant_path(path, variant):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{variant}{ext}"
+
+
+def _variants_path(path):
+    return os.path.join(os.path.dirname(path), VARIANTS_FILE)
+
+
+def _read_variants(path):
+    try:
+        with open(_variants_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def _source_key(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def create_variant(path, variant, layout="obs", compression="lzf", level=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Rewrite a .h5mu file with another chunking and compression
+    and record it as a variant of this file in the dataset directory,
+    see find_variant().
+
+    Parameters
+    ----------
+    path
+        Path to the .h5mu file
+    variant
+        Name of the variant, the file is written to <name>.<variant>.h5mu
+    layout
+        "obs" to chunk dense matrices and store sparse ones as CSR
+        for reading observations (cells), "var" to store them as CSC
+        for reading variables (features)
+    compression
+        One of "gzip", "lzf", "blosc", "zstd" or None
+    level
+        Compression level for gzip, blosc and zstd
+    chunk_bytes
+        Approximate size of the chunks in bytes
+    """
+    if variant == MMAP_VARIANT:
+        raise ValueError(f"Variant name {MMAP_VARIANT} is used for load(mmap=True), choose another one")
+    out_path = variant_path(path, variant)
+    repack(path, out_path, layout=layout, chunk_bytes=chunk_bytes, **_codec(compression, level))
+    record_variant(
+        path, variant, out_path, layout=layout, compression=compression, level=level, chunk_bytes=chunk_bytes
+    )
+    return out_path
+
+
+def record_variant(path, variant, out_path, **fields):
+    """
+    Record out_path, created from path, as a variant of this file
+    together with the size and modification time of path
+    so that find_variant() ignores it once path changes.
+    """
+    record = {"path": os.path.basename(out_path), **fields, "source": _source_key(path)}
+    # Re-read the records before writing so that variants
+    # created by other processes in the meantime are kept
+    with file_lock(_variants_path(path)):
+        variants = _read_variants(path)
+        variants.setdefault(os.path.basename(path), dict())[variant] = record
+        tmp_path = f"{_variants_path(path)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(variants, f, indent=1)
+        os.replace(tmp_path, _variants_path(path))
+
+
+def find_variant(path, variant):
+    """
+    Path to a variant of a file created with create_variant(),
+    or None if it does not exist or the file has changed since.
+    """
+    record = _read_variants(path).get(os.path.basename(path), dict()).get(variant)
+    if record is None:
+        return None
+    out_path = os.path.join(os.path.dirname(path), record["path"])
+    try:
+        if record["source"] != _source_key(path) or not os.path.exists(out_path):
+            return None
+    except OSError:
+        return None
+    return out_path
+
+
+def list_variants(path):
+    """
+    Records of all the variants created for a file.
+    """
+    return _read_variants(path).get(os.path.basename(path), dict())
@@ -0,0 +1,62 @@
+import os
+import stat
+
+
+def blob_path(store_dir, hashf_name, digest):
+    """
+    Location of a file with this checksum in a content-addressed store.
+    """
+    return os.path.join(store_dir, hashf_name, digest[:2], digest)
+
+
+def make_dirs(store_dir, blob):
+    """
+    Create the directories of the store down to the one of blob.
+
+    They get the same permissions as store_dir regardless of the umask
+    so that a store shared by a group (e.g. 2775) or by all users (e.g. 1777)
+    stays writable for everyone who shares it.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    mode = stat.S_IMODE(os.stat(store_dir).st_mode)
+    path = store_dir
+    for name in os.path.relpath(os.path.dirname(blob), store_dir).split(os.sep):
+        path = os.path.join(path, name)
+        try:
+            os.mkdir(path)
+        except FileExistsError:
+            continue
+        os.chmod(path, mode)
+
+
+def link(blob, data_path):
+    """
+    Make data_path point to a file in the store.
+
+    Hard links are used when possible so that the dataset directory
+    keeps working without the store, with symbolic links
+    as a fallback across file systems.
+    """
+    if os.path.exists(data_path) and os.path.samefile(blob, data_path):
+        return
+    tmp_path = f"{data_path}.{os.getpid()}.link"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(blob, tmp_path)
+    except OSError:
+        os.symlink(os.path.abspath(blob), tmp_path)
+    os.replace(tmp_path, data_path)
+
+
+def adopt(data_path, blob):
+    """
+    Add an already verified file to the store.
+    """
+    if os.path.exists(blob):
+        return
+    try:
+        os.link(data_path, blob)
+    except OSError:
+        # The store is on another file system, it will be filled on the next download
+        pass
@@ -0,0 +1,152 @@
+import os
+
+from .repack import record_variant, find_variant
+
+# Name of the variant of .h5 files written by transcode_10x_h5()
+TRANSCODED_VARIANT = "h5mu"
+
+
+class TenXH5:
+    """
+    Lazy access to a feature-barcode matrix in the 10x Genomics HDF5 format.
+
+    The matrix is stored as CSC with features in rows,
+    which is the same layout as CSR with cells in rows.
+    Indexing with cells (and optionally features) only reads
+    the matrix/data and matrix/indices ranges of the requested cells:
+
+        with TenXH5("filtered_feature_bc_matrix.h5") as m:
+            x = m[:1000]  # scipy.sparse.csr_matrix, 1000 cells x all features
+    """
+
+    def __init__(self, path):
+        import h5py
+
+        self.path = path
+        self.file = h5py.File(path, "r")
+        self.matrix = self.file["matrix"]
+        n_features, n_cells = self.matrix["shape"][()]
+        self.shape = (int(n_cells), int(n_features))
+        # One integer per cell, small enough to be kept in memory
+        self.indptr = self.matrix["indptr"][()]
+        self.dtype = self.matrix["data"].dtype
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def __repr__(self):
+        return f"TenXH5 with n_obs × n_vars = {self.shape[0]} × {self.shape[1]} backed at '{self.path}'"
+
+    @property
+    def obs_names(self):
+        import pandas as pd
+
+        return pd.Index(self.matrix["barcodes"].asstr()[()])
+
+    @property
+    def var(self):
+        import pandas as pd
+
+        features = self.matrix["features"]
+        var = pd.DataFrame(
+            {
+                "gene_ids": features["id"].asstr()[()],
+                "feature_types": features["feature_type"].asstr()[()],
+            },
+            index=pd.Index(features["name"].asstr()[()]),
+        )
+        for key in ["genome", "interval"]:
+            if key in features:
+                var[key] = features[key].asstr()[()]
+        return var
+
+    def _read_rows(self, start, stop):
+        from scipy.sparse import csr_matrix
+
+        begin, end = self.indptr[start], self.indptr[stop]
+        data = self.matrix["data"][begin:end]
+        indices = self.matrix["indices"][begin:end]
+        indptr = self.indptr[start : stop + 1] - begin
+        return csr_matrix((data, indices, indptr), shape=(stop - start, self.shape[1]))
+
+    def __getitem__(self, key):
+        import numpy as np
+        from scipy.sparse import vstack
+
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+
+        if isinstance(rows, slice) and rows.step in (None, 1):
+            start, stop, _ = rows.indices(self.shape[0])
+            x = self._read_rows(start, max(start, stop))
+        else:
+            rows = np.arange(self.shape[0])[rows]
+            if rows.ndim == 0:
+                x = self._read_rows(int(rows), int(rows) + 1)
+            elif len(rows) == 0:
+                x = self._read_rows(0, 0)
+            else:
+                # Read every run of consecutive cells at once
+                order = np.argsort(rows, kind="stable")
+                sorted_rows = rows[order]
+                runs = np.split(sorted_rows, np.where(np.diff(sorted_rows) != 1)[0] + 1)
+                x = vstack([self._read_rows(run[0], run[-1] + 1) for run in runs], format="csr")
+                x = x[np.argsort(order, kind="stable")]
+
+        if not (isinstance(cols, slice) and cols == slice(None)):
+            x = x[:, cols]
+        return x
+
+    def chunks(self, n_cells=10000):
+        """
+        Iterate over the matrix in blocks of cells,
+        yielding (start, stop, csr_matrix).
+        """
+        for start in range(0, self.shape[0], n_cells):
+            stop = min(start + n_cells, self.shape[0])
+            yield start, stop, self._read_rows(start, stop)
+
+
+def read_10x_h5_lazy(path):
+    """
+    Open a 10x Genomics .h5 file without reading the matrix into memory.
+    """
+    return TenXH5(path)
+
+
+def transcoded_path(data_path):
+    return os.path.splitext(data_path)[0] + ".h5mu"
+
+
+def find_transcoded(data_path):
+    """
+    Path to the .h5mu file converted from data_path with transcode_10x_h5(),
+    or None if it does not exist or data_path has changed since.
+    """
+    return find_variant(data_path, TRANSCODED_VARIANT)
+
+
+def transcode_10x_h5(data_path, h5mu_path=None):
+    """
+    Convert a 10x Genomics .h5 file to .h5mu once
+    so that it can be opened in backed mode.
+
+    The conversion reads the matrix into memory with muon,
+    the resulting file is then opened lazily on every following load.
+    It is recorded as a variant of the .h5 file, see find_transcoded().
+    """
+    import muon as mu
+
+    if h5mu_path is None:
+        h5mu_path = transcoded_path(data_path)
+    mdata = mu.read_10x_h5(data_path)
+    tmp_path = f"{h5mu_path}.{os.getpid()}.tmp"
+    mdata.write(tmp_path)
+    os.replace(tmp_path, h5mu_path)
+    record_variant(data_path, TRANSCODED_VARIANT, h5mu_path)
+    return h5mu_path
@@ -1,6 +1,127 @@
+import io
+import os
+import glob
+import gzip
+from contextlib import contextmanager
+
+
 def sizefmt(num, suffix="B"):
     for unit in ["", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi"]:
         if abs(num) < 1024.0:
             return f"{num:3.1f}{unit}{suffix}"
         num /= 1024.0
     return f"{num:.1f}Yi{suffix}"
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Hold an exclusive lock on path + ".lock"
+    that is shared between processes on the same machine
+    and, for most network file systems, across machines.
+
+    With blocking=False, BlockingIOError is raised
+    instead of waiting if the lock is held by someone else.
+    """
+    lock_path = path + ".lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    try:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+    except PermissionError:
+        # The lock file has been created by another user,
+        # it can still be locked through a read-only descriptor
+        fd = os.open(lock_path, os.O_RDONLY)
+    try:
+        try:
+            import fcntl
+
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except ImportError:
+            import msvcrt
+
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not blocking:
+                        raise BlockingIOError(f"{lock_path} is locked")
+                    # LK_LOCK gives up after 10 seconds
+                    continue
+        yield
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+
+def gzindex_path(path):
+    """
+    Path to the seek point index of a gzip-compressed file,
+    named after its current size and modification time
+    so that an index of an earlier version of the file is not used.
+    """
+    stat = os.stat(path)
+    return f"{path}.{stat.st_size}-{stat.st_mtime_ns}.gzindex"
+
+
+def remove_gzindex(path, keep=None):
+    """
+    Remove the seek point indices of a gzip-compressed file except keep.
+    """
+    for index_path in glob.glob(glob.escape(path) + ".*gzindex"):
+        if index_path != keep:
+            try:
+                os.remove(index_path)
+            except OSError:
+                pass
+
+
+@contextmanager
+def open_gzip(path, threads=None):
+    """
+    Open a gzip-compressed file for reading in text mode.
+
+    rapidgzip is used if it is installed. It decompresses with several threads
+    and keeps a seek point index next to the file (see gzindex_path())
+    so that later reads of the same archive do not have to inflate it
+    from the start again. Otherwise python-isal is used if it is installed,
+    with the gzip module from the standard library as a fallback.
+    """
+    if threads is None:
+        threads = os.cpu_count() or 1
+
+    try:
+        import rapidgzip
+    except ImportError:
+        rapidgzip = None
+
+    if rapidgzip is not None:
+        index_path = gzindex_path(path)
+        with rapidgzip.open(path, parallelization=threads) as raw:
+            if os.path.exists(index_path):
+                raw.import_index(index_path)
+            f = io.TextIOWrapper(raw)
+            try:
+                yield f
+            finally:
+                f.detach()
+            if not os.path.exists(index_path) and raw.block_offsets_complete():
+                # The index is only an optimisation, e.g. the directory can be read-only
+                tmp_path = f"{index_path}.{os.getpid()}.tmp"
+                try:
+                    raw.export_index(tmp_path)
+                    os.replace(tmp_path, index_path)
+                except OSError:
+                    pass
+                else:
+                    remove_gzindex(path, keep=index_path)
+        return
+
+    try:
+        from isal import igzip_threaded
+
+        f = igzip_threaded.open(path, "rt", threads=threads)
+    except ImportError:
+        f = gzip.open(path, "rt")
+    with f:
+        yield f
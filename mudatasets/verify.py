@@ -0,0 +1,146 @@
+import os
+import json
+import hashlib
+from hashlib import md5, sha1, sha256, sha512
+from threading import Lock
+from warnings import warn
+
+from .utils import file_lock
+
+HASHES = {
+    "md5": md5,
+    "sha1": sha1,
+    "sha256": sha256,
+    "sha512": sha512,
+}
+
+# Verified files are recorded in this file inside data_dir
+CACHE_FILE = ".verified.json"
+
+# Checksums are computed over reads of this size,
+# independently of the chunk size used for downloads
+HASH_BUFFER_SIZE = 1024 * 1024
+
+_lock = Lock()
+# Failures to write the cache are only reported once
+_warned = False
+
+
+def hash_name(finfo):
+    """
+    Name of the first supported checksum provided for a file in the registry,
+    or None if there is none.
+    """
+    for name in HASHES.keys():
+        if name in finfo:
+            return name
+    return None
+
+
+def hash_file(data_path, hashf, buffer_size=HASH_BUFFER_SIZE, digest=True):
+    """
+    Hash the contents of a file with a hash constructor such as hashlib.md5.
+
+    Returns the hex digest, or the hash object itself if digest=False
+    so that it can be updated further.
+    """
+    with open(data_path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            # Python 3.11+, reads into a reusable buffer
+            hash = hashlib.file_digest(f, hashf)
+        else:
+            hash = hashf()
+            buffer = bytearray(buffer_size)
+            view = memoryview(buffer)
+            for n in iter(lambda: f.readinto(buffer), 0):
+                hash.update(view[:n])
+    return hash.hexdigest() if digest else hash
+
+
+def _cache_path(data_dir):
+    return os.path.join(data_dir, CACHE_FILE)
+
+
+def _key(data_dir, data_path):
+    return os.path.relpath(os.path.abspath(data_path), os.path.abspath(data_dir))
+
+
+def _read_cache(data_dir):
+    try:
+        with open(_cache_path(data_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def _update_cache(data_dir, key, record):
+    # Re-read the cache before writing under the lock on the file
+    # so that records added by other processes in the meantime are kept
+    global _warned
+    try:
+        with _lock, file_lock(_cache_path(data_dir)):
+            cache = _read_cache(data_dir)
+            if record is None:
+                cache.pop(key, None)
+            else:
+                cache[key] = record
+            # Invalidate records for files that have been removed
+            cache = {k: v for k, v in cache.items() if os.path.exists(os.path.join(data_dir, k))}
+            tmp_path = f"{_cache_path(data_dir)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cache, f, indent=1)
+            os.replace(tmp_path, _cache_path(data_dir))
+    except OSError as e:
+        # The cache only saves hashing files again, e.g. data_dir can be read-only
+        if not _warned:
+            _warned = True
+            warn(f"Verified files cannot be recorded in {data_dir}, checksums will be computed again: {e}")
+
+
+def _stat_key(data_path):
+    stat = os.stat(data_path)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "inode": stat.st_ino,
+    }
+
+
+def write_record(data_dir, data_path, hashf_name, digest):
+    """
+    Record in the verification cache of data_dir that the file
+    with its current size, modification time and inode has this digest.
+    """
+    record = {**_stat_key(data_path), hashf_name: digest}
+    _update_cache(data_dir, _key(data_dir, data_path), record)
+
+
+def remove_record(data_dir, data_path):
+    key = _key(data_dir, data_path)
+    if key in _read_cache(data_dir):
+        _update_cache(data_dir, key, None)
+
+
+def is_verified(data_dir, data_path, finfo):
+    """
+    Check if the file has been verified against the checksum in finfo
+    according to the verification cache of data_dir.
+
+    A record is only valid while the size, modification time and inode
+    of the file are the same as when it was verified,
+    and while the registry provides the same checksum.
+    """
+    hashf_name = hash_name(finfo)
+    if hashf_name is None:
+        return False
+    record = _read_cache(data_dir).get(_key(data_dir, data_path))
+    if record is None:
+        return False
+    try:
+        stat_key = _stat_key(data_path)
+    except OSError:
+        return False
+    return (
+        all(record.get(k) == v for k, v in stat_key.items())
+        and record.get(hashf_name) == finfo[hashf_name]
+    )
@@ -0,0 +1,42 @@
+import os
+import hashlib
+
+import pytest
+
+from benchmarks.fixtures import Server, make_random, MiB
+
+
+@pytest.fixture
+def root(tmp_path):
+    # Files served by the local server
+    path = tmp_path / "root"
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    path = tmp_path / "data"
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def random_file(root):
+    """
+    Write a file of random bytes to the served directory
+    and return its path and md5 digest.
+    """
+
+    def make(name="file.bin", size=MiB, seed=0):
+        path = make_random(os.path.join(root, name), size, seed=seed)
+        with open(path, "rb") as f:
+            return path, hashlib.md5(f.read()).hexdigest()
+
+    return make
+
+
+@pytest.fixture
+def server(root):
+    with Server(root) as server:
+        yield server
@@ -0,0 +1,35 @@
+import os
+import stat
+import warnings
+
+import pytest
+
+import mudatasets
+from benchmarks.fixtures import file_info, make_h5mu, register
+
+
+@pytest.mark.skipif(os.name != "posix" or os.geteuid() == 0, reason="permissions are not enforced")
+def test_read_only_data_dir(server, root, data_dir):
+    path = make_h5mu(os.path.join(root, "data.h5mu"), n_obs=100, n_vars=(20, 50))
+    dset = register("synthetic_read_only", [file_info(path, server.url("data.h5mu"))])
+    dset.download(data_dir=data_dir, full=True, quiet=True)
+    os.remove(os.path.join(data_dir, ".verified.json"))
+    os.remove(os.path.join(data_dir, ".access.json"))
+
+    dirs = [data_dir, os.path.join(data_dir, "synthetic_read_only")]
+    for d in dirs:
+        os.chmod(d, stat.S_IRUSR | stat.S_IXUSR)
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            for _ in range(2):
+                mdata = mudatasets.load("synthetic_read_only", data_dir=data_dir, full=True, backed=False, quiet=True)
+                assert mdata.n_obs == 100
+    finally:
+        for d in dirs:
+            os.chmod(d, stat.S_IRWXU)
+
+    # Cache and access records cannot be written and are reported once each
+    messages = [str(w.message) for w in caught]
+    assert sum(m.startswith("Verified files cannot be recorded") for m in messages) == 1
+    assert sum(m.startswith("Access to files cannot be recorded") for m in messages) == 1
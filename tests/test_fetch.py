@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import hashlib
+import warnings
+
+import pytest
+import requests
+
+from benchmarks.fixtures import Server, file_info, register
+from mudatasets.fetch import fetch, fetch_segmented, make_session, part_path, segments_path, MIN_SEGMENT_SIZE
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _fetch(url, data_path, size, **kwargs):
+    # Returns the digest and the total progress reported
+    progress = []
+    digest = fetch(url, data_path, size, update=progress.append, hashf=hashlib.md5, **kwargs)
+    return digest, sum(progress)
+
+
+def test_resume_from_part(server, random_file, data_dir):
+    path, md5 = random_file()
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+    with open(part_path(data_path), "wb") as f:
+        f.write(_read(path)[: size // 2])
+
+    digest, progress = _fetch(server.url("file.bin"), data_path, size)
+
+    assert digest == md5
+    assert progress == size
+    assert _read(data_path) == _read(path)
+    assert not os.path.exists(part_path(data_path))
+    assert server.requests[-1]["range"] == f"bytes={size // 2}-"
+
+
+def test_server_ignoring_range(root, random_file, data_dir):
+    path, md5 = random_file()
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+    with open(part_path(data_path), "wb") as f:
+        f.write(b"x" * (size // 2))
+
+    # The whole file is sent with 200 and the .part file is overwritten
+    with Server(root, range=False) as server:
+        digest, progress = _fetch(server.url("file.bin"), data_path, size)
+
+    assert digest == md5
+    assert progress == size
+    assert _read(data_path) == _read(path)
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_download_resumed_bytes(root, random_file, data_dir, ranges):
+    path, md5 = random_file()
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "synthetic_resume", "file.bin")
+    os.makedirs(os.path.dirname(data_path))
+    with open(part_path(data_path), "wb") as f:
+        f.write(_read(path)[: size // 2])
+
+    events = []
+    with Server(root, range=ranges) as server:
+        dset = register("synthetic_resume", [file_info(path, server.url("file.bin"))])
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            dset.download(data_dir=data_dir, full=True, callback=events.append, quiet=True)
+
+    # Bytes of the .part file only count as resumed if the server continues from them
+    resumed = size // 2 if ranges else 0
+    download = [e for e in events if e["event"] == "download"]
+    assert [(e["bytes"], e["resumed"]) for e in download] == [(size - resumed, resumed)]
+    assert [e["bytes"] for e in events if e["event"] == "resume"] == ([resumed] if ranges else [])
+    assert _read(data_path) == _read(path)
+
+
+def test_range_not_satisfiable(server, random_file, data_dir):
+    path, md5 = random_file()
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+    with open(part_path(data_path), "wb") as f:
+        f.write(_read(path))
+
+    # The .part file is complete and the server answers 416
+    digest, progress = _fetch(server.url("file.bin"), data_path, size)
+
+    assert digest == md5
+    assert _read(data_path) == _read(path)
+    assert server.requests[-1]["range"] == f"bytes={size}-"
+
+
+def test_oversize_part(server, random_file, data_dir):
+    path, md5 = random_file()
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+    with open(part_path(data_path), "wb") as f:
+        f.write(b"x" * (size + 1))
+
+    # The .part file cannot belong to this file and is downloaded again
+    digest, progress = _fetch(server.url("file.bin"), data_path, size)
+
+    assert digest == md5
+    assert progress == size
+    assert _read(data_path) == _read(path)
+    assert server.requests[-1]["range"] is None
+
+
+def test_segmented(server, random_file, data_dir):
+    path, md5 = random_file(size=2 * MIN_SEGMENT_SIZE)
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+
+    digest, progress = _fetch(server.url("file.bin"), data_path, size, segments=4)
+
+    assert digest == md5
+    assert progress == size
+    assert _read(data_path) == _read(path)
+    assert not os.path.exists(segments_path(data_path))
+    # One request probes Range support, then every segment is requested once
+    ranges = [r["range"] for r in server.requests]
+    assert ranges[0] == "bytes=0-0"
+    step = size // 4
+    assert sorted(ranges[1:]) == sorted(f"bytes={i * step}-{(i + 1) * step - 1}" for i in range(4))
+
+
+def test_segmented_resume(server, random_file, data_dir):
+    path, md5 = random_file(size=2 * MIN_SEGMENT_SIZE)
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+
+    # Two segments of which the first one is complete and the second one is half written
+    content = _read(path)
+    half = size // 2
+    ranges = [[0, half - 1, half], [half, size - 1, half // 2]]
+    with open(part_path(data_path), "wb") as f:
+        f.write(content[: half + half // 2])
+        f.truncate(size)
+    with open(segments_path(data_path), "w") as f:
+        json.dump(ranges, f)
+
+    digest, progress = _fetch(server.url("file.bin"), data_path, size, segments=2)
+
+    assert digest == md5
+    assert progress == size
+    assert _read(data_path) == content
+    assert [r["range"] for r in server.requests[1:]] == [f"bytes={half + half // 2}-{size - 1}"]
+
+
+def test_segmented_without_range(root, random_file, data_dir):
+    path, md5 = random_file(size=2 * MIN_SEGMENT_SIZE)
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+
+    with Server(root, range=False) as server:
+        assert not fetch_segmented(server.url("file.bin"), data_path, size, segments=4)
+        assert not os.path.exists(part_path(data_path))
+        # The file is streamed over one connection instead
+        digest, progress = _fetch(server.url("file.bin"), data_path, size, segments=4)
+
+    assert digest == md5
+    assert _read(data_path) == _read(path)
+
+
+def test_retry_server_errors(server, random_file, data_dir):
+    path, md5 = random_file()
+    data_path = os.path.join(data_dir, "file.bin")
+    server.config["failures"] = 2
+
+    with make_session(retries=3, backoff=0) as session:
+        digest, progress = _fetch(server.url("file.bin"), data_path, os.path.getsize(path), session=session)
+
+    assert digest == md5
+    assert len(server.requests) == 3
+
+
+def test_retry_server_errors_exhausted(server, random_file, data_dir):
+    path, md5 = random_file()
+    data_path = os.path.join(data_dir, "file.bin")
+    server.config["failures"] = 10
+
+    with make_session(retries=2, backoff=0) as session:
+        with pytest.raises(requests.HTTPError):
+            _fetch(server.url("file.bin"), data_path, os.path.getsize(path), session=session)
+
+    assert len(server.requests) == 3
+    assert not os.path.exists(data_path)
+
+
+@pytest.mark.parametrize("content_length", [True, False])
+def test_retry_reset(root, random_file, data_dir, content_length):
+    path, md5 = random_file()
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+    events = []
+
+    # Without Content-Length, the size from the registry shows that the response is incomplete
+    with Server(root, content_length=content_length, reset_after=size // 3) as server:
+        with make_session(retries=3, backoff=0) as session:
+            digest, progress = _fetch(
+                server.url("file.bin"), data_path, size, session=session, emit=lambda e, **f: events.append(e)
+            )
+
+    assert digest == md5
+    assert progress == size
+    assert _read(data_path) == _read(path)
+    assert events == ["retry", "resume"]
+    # The download is resumed after the chunks that have been written
+    assert server.requests[0]["range"] is None
+    offset = int(re.match(r"bytes=(\d+)-$", server.requests[1]["range"]).group(1))
+    assert 0 < offset <= size // 3
+
+
+def test_segmented_retry_reset(server, random_file, data_dir):
+    path, md5 = random_file(size=2 * MIN_SEGMENT_SIZE)
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+    server.config["reset_after"] = size // 8
+
+    with make_session(retries=3, backoff=0, pool_size=4) as session:
+        digest, progress = _fetch(server.url("file.bin"), data_path, size, segments=4, session=session)
+
+    assert digest == md5
+    assert progress == size
+    assert _read(data_path) == _read(path)
+    # The probe, four segments and the rest of the segment that has been reset
+    assert len(server.requests) == 6
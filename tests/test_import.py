@@ -0,0 +1,33 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+# Heavy dependencies are only imported when data is downloaded or loaded
+DEFERRED = ["requests", "tqdm", "mudata", "anndata", "h5py"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import mudatasets",
+        "import mudatasets; mudatasets.list_datasets(); mudatasets.info('pbmc3k_multiome')",
+    ],
+)
+def test_deferred_imports(code):
+    # A new interpreter reports its imports with -X importtime and its modules afterwards
+    code += "; import sys, json; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True, cwd=ROOT
+    )
+    modules = {name.split(".")[0] for name in json.loads(result.stdout)}
+    assert "mudatasets" in modules
+    assert sorted(modules.intersection(DEFERRED)) == []
+
+    # -X importtime lists every module that has been imported
+    timed = {line.rsplit("|", 1)[1].strip().split(".")[0] for line in result.stderr.splitlines() if "|" in line}
+    assert sorted(timed.intersection(DEFERRED)) == []
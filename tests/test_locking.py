@@ -0,0 +1,45 @@
+import os
+import multiprocessing
+
+from benchmarks.fixtures import Server, file_info, register, MiB
+
+N_PROCESSES = 4
+
+
+def _download(files, data_dir, barrier, results):
+    # Runs in a new process, the dataset is registered there again
+    dset = register("synthetic_locking", files)
+    events = []
+    barrier.wait()
+    dset.download(data_dir=data_dir, full=True, callback=events.append, quiet=True)
+    results.put({"events": events, "lock_wait": dset.lock_wait})
+
+
+def test_concurrent_processes(root, random_file, data_dir):
+    paths = [random_file(name, size=2 * MiB, seed=i)[0] for i, name in enumerate(["a.bin", "b.bin"])]
+
+    ctx = multiprocessing.get_context("spawn")
+    barrier, results = ctx.Barrier(N_PROCESSES), ctx.Queue()
+    # Downloads take about a second so that the processes overlap
+    with Server(root, bandwidth=4 * MiB) as server:
+        files = [file_info(path, server.url(os.path.basename(path))) for path in paths]
+        processes = [
+            ctx.Process(target=_download, args=(files, data_dir, barrier, results)) for _ in range(N_PROCESSES)
+        ]
+        for p in processes:
+            p.start()
+        outcomes = [results.get(timeout=120) for _ in processes]
+        for p in processes:
+            p.join()
+            assert p.exitcode == 0
+
+    # Every file has been downloaded by exactly one process, the others waited for it
+    downloads = [e["file"] for o in outcomes for e in o["events"] if e["event"] == "download"]
+    assert sorted(downloads) == ["a.bin", "b.bin"]
+    for outcome in outcomes:
+        assert set(outcome["lock_wait"].keys()) == {"a.bin", "b.bin"}
+    assert max(o["lock_wait"]["a.bin"] for o in outcomes) > 0.1
+    for path in paths:
+        data_path = os.path.join(data_dir, "synthetic_locking", os.path.basename(path))
+        with open(path, "rb") as f, open(data_path, "rb") as g:
+            assert f.read() == g.read()
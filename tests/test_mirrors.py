@@ -0,0 +1,94 @@
+import os
+import time
+import socket
+import hashlib
+
+from benchmarks.fixtures import Server
+from mudatasets.fetch import fetch, probe, make_session, MIN_SEGMENT_SIZE
+
+
+def _closed_url(name):
+    # URL on a port that refuses connections
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}/{name}"
+
+
+def _segment_ranges(server):
+    # Range requests for segments, without the probes
+    return [r["range"] for r in server.requests if r["range"] not in (None, "bytes=0-0")]
+
+
+def test_probe_dead_mirror(server, random_file):
+    random_file()
+    dead = _closed_url("file.bin")
+
+    start = time.perf_counter()
+    mirrors = probe([dead, server.url("file.bin")])
+
+    # Unreachable mirrors are not retried
+    assert time.perf_counter() - start < 1
+    assert [m["url"] for m in mirrors] == [server.url("file.bin"), dead]
+    assert mirrors[0]["ranges"]
+    assert mirrors[1]["seconds"] == float("inf")
+
+
+def test_dead_first_mirror(server, random_file, data_dir):
+    path, md5 = random_file()
+    data_path = os.path.join(data_dir, "file.bin")
+    events = []
+
+    with make_session(backoff=0) as session:
+        digest = fetch(
+            [_closed_url("file.bin"), server.url("file.bin")],
+            data_path,
+            os.path.getsize(path),
+            hashf=hashlib.md5,
+            session=session,
+            emit=lambda e, **f: events.append(e),
+        )
+
+    assert digest == md5
+    assert events == ["probe"]
+
+
+def test_failover(root, random_file, data_dir):
+    path, md5 = random_file()
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+
+    # The fastest mirror closes the connection in the middle of the file
+    with Server(root, reset_after=size // 2) as fast, Server(root, latency=0.2) as slow:
+        with make_session(backoff=0) as session:
+            digest = fetch(
+                [slow.url("file.bin"), fast.url("file.bin")], data_path, size, hashf=hashlib.md5, session=session
+            )
+        fast_ranges, slow_ranges = _segment_ranges(fast), _segment_ranges(slow)
+
+    assert digest == md5
+    # The transfer continued from the other mirror
+    assert fast_ranges == []
+    assert len(slow_ranges) == 1
+    assert 0 < int(slow_ranges[0][len("bytes=") : -1]) <= size // 2
+
+
+def test_segments_over_mirrors(root, random_file, data_dir):
+    path, md5 = random_file(size=2 * MIN_SEGMENT_SIZE)
+    size = os.path.getsize(path)
+    data_path = os.path.join(data_dir, "file.bin")
+
+    with Server(root) as first, Server(root) as second:
+        with make_session(backoff=0, pool_size=4) as session:
+            digest = fetch(
+                [first.url("file.bin"), second.url("file.bin")],
+                data_path,
+                size,
+                segments=4,
+                hashf=hashlib.md5,
+                session=session,
+            )
+        ranges = [_segment_ranges(first), _segment_ranges(second)]
+
+    assert digest == md5
+    assert [len(r) for r in ranges] == [2, 2]
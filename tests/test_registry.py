@@ -0,0 +1,12 @@
+import json
+
+from mudatasets import registry
+
+
+def test_index_up_to_date(tmp_path):
+    # Regenerate with python -m mudatasets.registry after adding or changing a dataset
+    index = registry.build_index(path=str(tmp_path / "index.json"))
+    with open(registry.INDEX_PATH) as f:
+        committed = json.load(f)
+    assert sorted(committed.keys()) == sorted(registry._dataset_modules())
+    assert committed == json.loads(json.dumps(index))
@@ -0,0 +1,38 @@
+import os
+import warnings
+
+from benchmarks.fixtures import file_info, register
+
+
+def test_corrupt_store_file(server, random_file, tmp_path):
+    path, md5 = random_file()
+    data_dir, store_dir = str(tmp_path / "data"), str(tmp_path / "store")
+    dset = register("synthetic_store", [file_info(path, server.url("file.bin"))])
+
+    def download():
+        events = []
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            dset.download(data_dir=data_dir, full=True, store_dir=store_dir, callback=events.append, quiet=True)
+        return events
+
+    download()
+    data_path = os.path.join(data_dir, "synthetic_store", "file.bin")
+    with open(path, "rb") as f:
+        content = f.read()
+
+    # The file in data_dir is a link to the file in the store
+    os.chmod(data_path, 0o644)
+    with open(data_path, "r+b") as f:
+        f.write(b"xxxx")
+
+    events = download()
+    verify = [e for e in events if e["event"] == "verify"]
+    assert [e["ok"] for e in verify] == [False, False]
+    assert [e["file"] for e in events if e["event"] == "download"] == ["file.bin"]
+    with open(data_path, "rb") as f:
+        assert f.read() == content
+
+    # The file that has been downloaded again is recorded as verified
+    events = download()
+    assert [(e["cache"], e["ok"]) for e in events if e["event"] == "verify"] == [("hit", True)]
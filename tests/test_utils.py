@@ -0,0 +1,32 @@
+import os
+import gzip
+
+import pytest
+
+from mudatasets.utils import open_gzip
+
+
+def _write(path, line, n):
+    with gzip.open(path, "wt") as f:
+        f.write(line * n)
+
+
+def test_gzindex_of_changed_archive(tmp_path):
+    pytest.importorskip("rapidgzip")
+    path = str(tmp_path / "counts.tsv.gz")
+
+    _write(path, "first\n", 300000)
+    with open_gzip(path, threads=2) as f:
+        assert sum(1 for _ in f) == 300000
+    indices = [name for name in os.listdir(tmp_path) if name.endswith(".gzindex")]
+    assert len(indices) == 1
+
+    # The index of the earlier archive is not used and is replaced
+    _write(path, "second line\n", 900000)
+    with open_gzip(path, threads=2) as f:
+        assert set(f) == {"second line\n"}
+    new_indices = [name for name in os.listdir(tmp_path) if name.endswith(".gzindex")]
+    assert len(new_indices) == 1 and new_indices != indices
+
+    with open_gzip(path, threads=2) as f:
+        assert sum(1 for _ in f) == 900000